@@ -1,7 +1,15 @@
 #!/usr/bin/env python3
 import os
+import re
+import subprocess
 import sys
+import atexit
+import gzip
+import mimetypes
+import threading
 from pathlib import Path
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile, mkstemp
+from urllib.parse import quote
 
 
 def _augment_sys_path_for_venv():
@@ -37,14 +45,44 @@ try:
 except Exception:
     pass
 
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify
+import orjson
+from flask import Flask, Request, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, make_response, abort
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
 # Import the existing extraction logic
 import extract_labels_ultratax as ultra
+from curation.rerank import rerank_suggestions
+
+# Optional curation helpers (best effort; features/suggestions degrade without them)
+try:
+    from curation.extract_features import extract_page_features, open_pdf
+except ImportError:
+    extract_page_features = open_pdf = None
+try:
+    from curation.suggest import embed_pdf_page, search_neighbors, start_warmup as start_suggest_warmup
+except ImportError:
+    embed_pdf_page = search_neighbors = start_suggest_warmup = None
+
+class _UploadRequest(Request):
+    # Multipart file parts land in a spooled temp file: small uploads stay in
+    # memory, large PDFs roll over to disk once instead of per-chunk decisions
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=16 << 20)
+
 
 app = Flask(__name__)
 app.secret_key = "dev-secret"
+app.request_class = _UploadRequest
+# Upper bound for /upload and /upload_stream bodies (413 beyond it)
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_MB", "512")) << 20
+
+# Let the reverse proxy stream file bodies: "apache" uses X-Sendfile,
+# "nginx" uses X-Accel-Redirect under SENDFILE_PREFIX (internal locations
+# <prefix>/pdf/ -> Source_PDF/ and <prefix>/gt/ -> Ground_Truth/).
+SENDFILE_BACKEND = os.environ.get("SENDFILE_BACKEND", "").strip().lower()
+SENDFILE_PREFIX = os.environ.get("SENDFILE_PREFIX", "/protected").rstrip("/")
+app.use_x_sendfile = SENDFILE_BACKEND == "apache"
 
 ROOT = Path(__file__).resolve().parent
 SOURCE_DIR = ROOT / "Source_PDF"
@@ -52,17 +90,88 @@ OUT_DIR = ROOT / "Ground_Truth"
 DATASET_INDEX = ROOT / "dataset" / "v2" / "index" / "v2.jsonl"
 DATASET_IMAGES = ROOT / "dataset" / "v2" / "images"
 DATASET_ALIASES = ROOT / "dataset" / "v2" / "aliases.json"
+# Encoding of curated page images: png (lossless, default), jpg or webp. The lossy
+# formats encode much faster; Azure Document Intelligence accepts png and jpg only.
+PAGE_IMAGE_FORMAT = os.environ.get("PAGE_IMAGE_FORMAT", "png").strip().lower()
 SOURCE_DIR.mkdir(parents=True, exist_ok=True)
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 DATASET_IMAGES.mkdir(parents=True, exist_ok=True)
 
+# Load the CLIP model and FAISS index in the background so the first suggestion
+# request doesn't stall on them. Skipped in the debug reloader's parent process,
+# which never serves requests, and when SUGGEST_WARMUP=0.
+if (
+    start_suggest_warmup is not None
+    and os.environ.get("SUGGEST_WARMUP", "1") != "0"
+    and not (__name__ == "__main__" and not os.environ.get("WERKZEUG_RUN_MAIN"))
+):
+    start_suggest_warmup(ROOT)
+
+_LABEL_PAGE_RE = re.compile(r"^(.+)_P(\d+)$")
+_EMB_FILE_RE = re.compile(r"clip_vitb32(?:_(v\d+))?\.jsonl$")
+_EMB_VERSION_RE = re.compile(r"clip_vitb32_v(\d+)\.jsonl$")
+_MANIFEST_VERSION_RE = re.compile(r"v(\d+)\.json$")
+_SAFE_FN = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9._-]*$")
+
+
+def _load_json(path: Path):
+    return orjson.loads(path.read_bytes())
+
+
+def _atomic_write_json(path: Path, obj) -> None:
+    # Indented UTF-8 with trailing newline, written to a sibling temp file and
+    # swapped in with os.replace so a crash never leaves a partial mapping
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS))
+    os.replace(tmp, path)
+
+
+# Parsed mapping JSON per path, keyed on (st_mtime_ns, st_size) of the file it came from
+_MAPPING_CACHE: dict[Path, tuple[tuple[int, int], dict]] = {}
+# Held across load -> mutate -> save so concurrent label edits don't overwrite each other
+_MAPPING_LOCK = threading.RLock()
+
+
+def _stat_key(path: Path) -> tuple[int, int]:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def _copy_mapping(data: dict) -> dict:
+    # Page entries are flat dicts and the only part handlers mutate
+    return {**data, "pages": [dict(e) for e in data.get("pages", [])]}
+
+
+def _load_mapping(path: Path) -> dict:
+    """Return a private copy of the mapping at path, parsing only when the file changed."""
+    key = _stat_key(path)
+    hit = _MAPPING_CACHE.get(path)
+    if hit is None or hit[0] != key:
+        hit = (key, _load_json(path))
+        _MAPPING_CACHE[path] = hit
+    return _copy_mapping(hit[1])
+
+
+def _save_mapping(path: Path, data: dict) -> None:
+    dir_before = path.parent.stat().st_mtime_ns
+    _atomic_write_json(path, data)
+    _MAPPING_CACHE[path] = (_stat_key(path), _copy_mapping(data))
+    if path.parent == OUT_DIR:
+        _refresh_resolve_cache(path, dir_before)
+
+
+# Parsed aliases.json, reused until the file's mtime changes
+_ALIASES_CACHE = {"mtime": -1, "data": {}}
+
 
 def _load_aliases() -> dict:
     try:
         if DATASET_ALIASES.exists():
-            import json
-            with open(DATASET_ALIASES, "r", encoding="utf-8") as f:
-                return json.load(f)
+            mtime = DATASET_ALIASES.stat().st_mtime_ns
+            if mtime != _ALIASES_CACHE["mtime"]:
+                _ALIASES_CACHE["data"] = _load_json(DATASET_ALIASES)
+                _ALIASES_CACHE["mtime"] = mtime
+            return _ALIASES_CACHE["data"]
     except Exception:
         pass
     return {}
@@ -70,26 +179,62 @@ def _load_aliases() -> dict:
 
 def _save_aliases(aliases: dict) -> None:
     try:
-        import json
         DATASET_ALIASES.parent.mkdir(parents=True, exist_ok=True)
-        with open(DATASET_ALIASES, "w", encoding="utf-8") as f:
-            json.dump(aliases, f, ensure_ascii=False, indent=2)
+        _atomic_write_json(DATASET_ALIASES, aliases)
     except Exception:
         pass
+    _ALIASES_CACHE["mtime"] = -1
 
 
-def _canonicalize_label(label: str) -> str:
-    aliases = _load_aliases()
+def _canonicalize_label(label: str, aliases: dict | None = None) -> str:
+    if aliases is None:
+        aliases = _load_aliases()
     return aliases.get(label, label)
 
 
+# stem -> (OUT_DIR st_mtime_ns, resolved path); any change to the directory invalidates it
+_RESOLVE_CACHE: dict[str, tuple[int, Path | None]] = {}
+
+
 def _resolve_json_path(stem: str, name: str | None = None) -> Path | None:
     if name:
         p = OUT_DIR / name
         return p if p.exists() else None
-    # else pick the most recent by mtime matching stem_*.json
-    candidates = sorted(OUT_DIR.glob(f"{stem}_*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
-    return candidates[0] if candidates else None
+    dir_mtime = OUT_DIR.stat().st_mtime_ns
+    cached = _RESOLVE_CACHE.get(stem)
+    if cached and cached[0] == dir_mtime and (cached[1] is None or cached[1].exists()):
+        return cached[1]
+    # else pick the most recent by mtime matching stem_*.json; one scandir pass
+    # with a prefix/suffix test instead of glob's fnmatch + Path.stat per match
+    prefix = f"{stem}_"
+    best = None
+    best_mtime = -1
+    with os.scandir(OUT_DIR) as it:
+        for ent in it:
+            name = ent.name
+            if not (name.startswith(prefix) and name.endswith(".json")):
+                continue
+            mtime = ent.stat().st_mtime_ns
+            if mtime > best_mtime:
+                best, best_mtime = ent.path, mtime
+    result = Path(best) if best else None
+    _RESOLVE_CACHE[stem] = (dir_mtime, result)
+    return result
+
+
+def _refresh_resolve_cache(saved: Path, dir_before: int) -> None:
+    # The temp-file + os.replace save bumps OUT_DIR's mtime without changing which
+    # files exist; carry entries that were current before the save forward instead
+    # of letting every label edit force a rescan. The saved file is now the newest
+    # match for any stem whose pattern it fits.
+    dir_after = OUT_DIR.stat().st_mtime_ns
+    name = saved.name
+    for stem, (mt, result) in list(_RESOLVE_CACHE.items()):
+        if mt != dir_before:
+            continue
+        if name.startswith(f"{stem}_") and name.endswith(".json"):
+            result = saved
+        _RESOLVE_CACHE[stem] = (dir_after, result)
 
 
 @app.route("/")
@@ -99,18 +244,78 @@ def index():
     return render_template("upload.html", existing=[p.name for p in existing])
 
 
+def _is_pdf_name(fn: str | None) -> bool:
+    # Only the 4-char tail needs lowering
+    return bool(fn) and fn[-4:].lower() == ".pdf"
+
+
+def _safe_pdf_filename(fn: str) -> str:
+    # Plain names need no sanitizing; anything with path or odd chars goes through secure_filename
+    return fn if _SAFE_FN.match(fn) else secure_filename(fn)
+
+
 @app.route("/upload", methods=["POST"])
 def upload():
     f = request.files.get("pdf")
-    if not f or not f.filename.lower().endswith(".pdf"):
+    if not f or not _is_pdf_name(f.filename):
         flash("Please choose a PDF file.")
         return redirect(url_for("index"))
-    filename = secure_filename(f.filename)
+    filename = _safe_pdf_filename(f.filename)
     pdf_path = SOURCE_DIR / filename
-    f.save(str(pdf_path))
+    f.save(str(pdf_path), buffer_size=1 << 20)
     # Read UltraTax mode checkbox (controls P1/P2 normalization)
     apply_prefix = bool(request.form.get("ultratax_mode"))
 
+    out_path = _generate_mapping(pdf_path, apply_prefix)
+    flash(f"Generated {out_path.name}")
+    return redirect(url_for("edit", stem=pdf_path.stem, name=out_path.name))
+
+
+@app.route("/upload_stream", methods=["POST"])
+def upload_stream():
+    """Upload a PDF sent as the raw request body (no multipart parsing).
+
+    Filename comes from ?filename= or the X-Filename header; ?ultratax_mode=1
+    enables P1/P2 normalization. The body is copied to disk in 1 MiB blocks.
+    """
+    raw_name = request.args.get("filename") or request.headers.get("X-Filename") or ""
+    if not _is_pdf_name(raw_name):
+        return jsonify({"ok": False, "error": "a .pdf filename is required"}), 400
+    filename = _safe_pdf_filename(raw_name)
+    pdf_path = SOURCE_DIR / filename
+    # Per-request temp name: concurrent uploads of the same filename never share a .part
+    fd, tmp_name = mkstemp(dir=SOURCE_DIR, suffix=".part")
+    part_path = Path(tmp_name)
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = request.stream.read(1 << 20)
+                if not chunk:
+                    break
+                out.write(chunk)
+                written += len(chunk)
+    except BaseException:
+        # 413 or a client disconnect mid-body: don't leave the partial file behind
+        part_path.unlink(missing_ok=True)
+        raise
+    if not written:
+        part_path.unlink(missing_ok=True)
+        return jsonify({"ok": False, "error": "empty upload"}), 400
+    # mkstemp creates 0600; give the PDF the usual permissions of an uploaded file
+    os.chmod(part_path, 0o644)
+    os.replace(part_path, pdf_path)
+    apply_prefix = request.args.get("ultratax_mode", "") in ("1", "true", "True", "on")
+
+    out_path = _generate_mapping(pdf_path, apply_prefix)
+    return jsonify({
+        "ok": True,
+        "name": out_path.name,
+        "edit_url": url_for("edit", stem=pdf_path.stem, name=out_path.name),
+    })
+
+
+def _generate_mapping(pdf_path: Path, apply_prefix: bool) -> Path:
     # Generate the enhanced JSON using existing logic
     out_path = ultra.build_bookmark_gt(
         pdf_path=pdf_path,
@@ -120,8 +325,9 @@ def upload():
         source="UltraTax",
         apply_prefix=apply_prefix,
     )
-    flash(f"Generated {out_path.name}")
-    return redirect(url_for("edit", stem=pdf_path.stem, name=out_path.name))
+    # An in-place overwrite of an existing mapping leaves the directory mtime unchanged
+    _RESOLVE_CACHE.pop(pdf_path.stem, None)
+    return out_path
 
 
 @app.route("/edit/<stem>", methods=["GET", "POST"])
@@ -137,29 +343,29 @@ def edit(stem: str):
         flash("Mapping not found. Upload the PDF first.")
         return redirect(url_for("index"))
 
-    import json
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    if request.method == "POST":
-        # Update labels from form inputs named label_<page>
-        changed = 0
-        for entry in data.get("pages", []):
-            pno = entry.get("page")
-            field = f"label_{pno}"
-            if field in request.form:
-                new_label = request.form.get(field, "").strip()
-                if new_label and new_label != entry.get("label"):
-                    entry["label"] = new_label
-                    entry["updated_label"] = True
-                    changed += 1
-        # Recompute multipage flags
-        data["pages"] = ultra._apply_multipage_flags(data.get("pages", []))
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            f.write("\n")
-        flash(f"Saved changes ({changed} labels updated)")
-        return redirect(url_for("edit", stem=stem, name=json_path.name))
+    with _MAPPING_LOCK:
+        data = _load_mapping(json_path)
+
+        if request.method == "POST":
+            # Update labels from form inputs named label_<page>
+            changed = 0
+            for entry in data.get("pages", []):
+                pno = entry.get("page")
+                field = f"label_{pno}"
+                if field in request.form:
+                    new_label = request.form.get(field, "").strip()
+                    if new_label and new_label != entry.get("label"):
+                        entry["label"] = new_label
+                        entry["updated_label"] = True
+                        changed += 1
+            if not changed:
+                flash("No changes")
+                return redirect(url_for("edit", stem=stem, name=json_path.name))
+            # Recompute multipage flags
+            data["pages"] = ultra._apply_multipage_flags(data.get("pages", []))
+            _save_mapping(json_path, data)
+            flash(f"Saved changes ({changed} labels updated)")
+            return redirect(url_for("edit", stem=stem, name=json_path.name))
 
     return render_template(
         "edit.html",
@@ -169,31 +375,66 @@ def edit(stem: str):
     )
 
 
+@app.get("/api/mapping/<stem>")
+def api_mapping(stem: str):
+    """Return the raw mapping JSON with an ETag so clients can revalidate with a 304."""
+    name = request.args.get("name")
+    json_path = _resolve_json_path(stem, name=name)
+    if not json_path or not json_path.exists():
+        return jsonify({"ok": False, "error": "mapping not found"}), 404
+    # Bytes and tag from the same open file, so a concurrent save can't mismatch them
+    with open(json_path, "rb") as f:
+        st = os.fstat(f.fileno())
+        body = f.read()
+    resp = app.response_class(body, mimetype="application/json")
+    # Weak: the gzip hook may re-encode the body without changing its meaning
+    resp.set_etag(f"{st.st_mtime_ns:x}-{st.st_size:x}", weak=True)
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+
+def _send_file(directory: Path, filename: str, location: str, as_attachment: bool = False, max_age: int | None = None):
+    if SENDFILE_BACKEND != "nginx":
+        # conditional: ETag/Last-Modified for 304s plus Range support; the body goes
+        # through the WSGI server's file wrapper (sendfile) when it provides one
+        return send_from_directory(
+            str(directory), filename, as_attachment=as_attachment,
+            conditional=True, etag=True, max_age=max_age,
+        )
+    path = safe_join(str(directory), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    resp = make_response("")
+    resp.headers["X-Accel-Redirect"] = f"{SENDFILE_PREFIX}/{location}/{quote(filename)}"
+    resp.headers["Content-Type"] = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if as_attachment:
+        resp.headers["Content-Disposition"] = f'attachment; filename="{Path(filename).name}"'
+    if max_age:
+        resp.headers["Cache-Control"] = f"public, max-age={max_age}"
+    return resp
+
+
 @app.route("/download/<path:filename>")
 def download(filename: str):
-    return send_from_directory(str(OUT_DIR), filename, as_attachment=True)
+    return _send_file(OUT_DIR, filename, "gt", as_attachment=True)
 
 @app.route("/pdf/<path:filename>")
 def serve_pdf(filename: str):
-    # Serve source PDFs for previewing specific pages
-    return send_from_directory(str(SOURCE_DIR), filename)
+    # Serve source PDFs for previewing specific pages; uploads don't change in place,
+    # so let the browser reuse them across page previews
+    return _send_file(SOURCE_DIR, filename, "pdf", max_age=3600)
 
 
 def _derive_base_and_page(label: str) -> tuple[str, int]:
-    import re as _re
-    m = _re.match(r"^(.+)_P(\d+)$", label)
-    if m:
-        return m.group(1), int(m.group(2))
-    return label, 1
+    m = _LABEL_PAGE_RE.match(label)
+    return (m.group(1), int(m.group(2))) if m else (label, 1)
 
 
-def _append_curated_record(mapping: dict, page_entry: dict, json_name: str) -> None:
-    # Ensure dataset index dir exists
-    DATASET_INDEX.parent.mkdir(parents=True, exist_ok=True)
+def _build_curated_record(mapping: dict, page_entry: dict, json_name: str, aliases: dict | None = None, pdf_doc=None) -> dict:
     # Build minimal record
     # Canonicalize label via alias mapping
     cur_lbl = page_entry.get("label", "Other")
-    can_lbl = _canonicalize_label(cur_lbl)
+    can_lbl = _canonicalize_label(cur_lbl, aliases)
     base_label, page_in_form = _derive_base_and_page(can_lbl)
     record = {
         "document": mapping.get("document"),
@@ -207,14 +448,8 @@ def _append_curated_record(mapping: dict, page_entry: dict, json_name: str) -> N
         "raw_label": page_entry.get("raw_label", ""),
         "source_json": str((OUT_DIR / json_name).as_posix()),
     }
-    # Remove any existing entries for this doc#page to avoid duplicates
-    try:
-        _ = _delete_curated_records(doc=record["document"], page=record["page"], delete_images=True)
-    except Exception:
-        pass
     # Optional: extract image + words/boxes (best effort)
     try:
-        from curation.extract_features import extract_page_features
         pdf_path = SOURCE_DIR / mapping.get("document")
         feats = extract_page_features(
             pdf_path=pdf_path,
@@ -222,6 +457,8 @@ def _append_curated_record(mapping: dict, page_entry: dict, json_name: str) -> N
             images_root=DATASET_IMAGES,
             base_label=base_label,
             document_name=mapping.get("document"),
+            pdf_doc=pdf_doc,
+            image_format=PAGE_IMAGE_FORMAT,
         )
         if feats:
             # Store image path relative to repo root for portability
@@ -230,11 +467,19 @@ def _append_curated_record(mapping: dict, page_entry: dict, json_name: str) -> N
             record.update(feats)
     except Exception:
         pass
+    return record
+
+
+def _append_curated_record(mapping: dict, page_entry: dict, json_name: str, aliases: dict | None = None) -> None:
+    record = _build_curated_record(mapping, page_entry, json_name, aliases)
+    _append_curated_records([record])
+
 
-    import json as _json
-    with open(DATASET_INDEX, "a", encoding="utf-8") as f:
-        f.write(_json.dumps(record, ensure_ascii=False))
-        f.write("\n")
+def _find_page(data: dict, page: int) -> dict | None:
+    for e in data.get("pages", []):
+        if int(e.get("page")) == int(page):
+            return e
+    return None
 
 
 @app.post("/api/update_label/<stem>/<int:page>")
@@ -243,30 +488,27 @@ def api_update_label(stem: str, page: int):
     json_path = _resolve_json_path(stem, name=name)
     if not json_path or not json_path.exists():
         return jsonify({"ok": False, "error": "mapping not found"}), 404
-    import json
     try:
-        payload = request.get_json(force=True)
+        payload = orjson.loads(request.get_data(cache=False))
     except Exception:
         payload = {}
     new_label = (payload.get("label") or "").strip()
     if not new_label:
         return jsonify({"ok": False, "error": "label required"}), 400
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    updated = False
-    for e in data.get("pages", []):
-        if int(e.get("page")) == int(page):
-            e["label"] = new_label
-            e["updated_label"] = True
-            updated = True
-            break
-    if not updated:
-        return jsonify({"ok": False, "error": "page not found"}), 404
-    # Recompute multipage flags and save
-    data["pages"] = ultra._apply_multipage_flags(data.get("pages", []))
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-        f.write("\n")
+    with _MAPPING_LOCK:
+        data = _load_mapping(json_path)
+        entry = _find_page(data, page)
+        if entry is None:
+            return jsonify({"ok": False, "error": "page not found"}), 404
+        relabeled = entry.get("label") != new_label
+        if not relabeled and entry.get("updated_label"):
+            return jsonify({"ok": True})
+        entry["label"] = new_label
+        entry["updated_label"] = True
+        # Multipage flags depend only on labels
+        if relabeled:
+            data["pages"] = ultra._apply_multipage_flags(data.get("pages", []))
+        _save_mapping(json_path, data)
     return jsonify({"ok": True})
 
 
@@ -276,24 +518,20 @@ def api_restore_label(stem: str, page: int):
     json_path = _resolve_json_path(stem, name=name)
     if not json_path or not json_path.exists():
         return jsonify({"ok": False, "error": "mapping not found"}), 404
-    import json
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    found = False
-    restored = None
-    for e in data.get("pages", []):
-        if int(e.get("page")) == int(page):
-            restored = e.get("auto_label", e.get("label"))
-            e["label"] = restored
-            e["updated_label"] = False
-            found = True
-            break
-    if not found:
-        return jsonify({"ok": False, "error": "page not found"}), 404
-    data["pages"] = ultra._apply_multipage_flags(data.get("pages", []))
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-        f.write("\n")
+    with _MAPPING_LOCK:
+        data = _load_mapping(json_path)
+        entry = _find_page(data, page)
+        if entry is None:
+            return jsonify({"ok": False, "error": "page not found"}), 404
+        restored = entry.get("auto_label", entry.get("label"))
+        relabeled = entry.get("label") != restored
+        if not relabeled and not entry.get("updated_label"):
+            return jsonify({"ok": True, "label": restored})
+        entry["label"] = restored
+        entry["updated_label"] = False
+        if relabeled:
+            data["pages"] = ultra._apply_multipage_flags(data.get("pages", []))
+        _save_mapping(json_path, data)
     return jsonify({"ok": True, "label": restored})
 
 
@@ -303,16 +541,21 @@ def api_restore_all(stem: str):
     json_path = _resolve_json_path(stem, name=name)
     if not json_path or not json_path.exists():
         return jsonify({"ok": False, "error": "mapping not found"}), 404
-    import json
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    for e in data.get("pages", []):
-        e["label"] = e.get("auto_label", e.get("label"))
-        e["updated_label"] = False
-    data["pages"] = ultra._apply_multipage_flags(data.get("pages", []))
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-        f.write("\n")
+    with _MAPPING_LOCK:
+        data = _load_mapping(json_path)
+        relabeled = dirty = False
+        for e in data.get("pages", []):
+            restored = e.get("auto_label", e.get("label"))
+            if e.get("label") != restored:
+                e["label"] = restored
+                relabeled = True
+            if e.get("updated_label"):
+                dirty = True
+            e["updated_label"] = False
+        if relabeled:
+            data["pages"] = ultra._apply_multipage_flags(data.get("pages", []))
+        if relabeled or dirty:
+            _save_mapping(json_path, data)
     return jsonify({"ok": True})
 
 
@@ -323,9 +566,7 @@ def api_curate_page(stem: str, page: int):
     json_path = _resolve_json_path(stem, name=name)
     if not json_path or not json_path.exists():
         return jsonify({"ok": False, "error": "mapping not found"}), 404
-    import json
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = _load_mapping(json_path)
     # Find page entry
     entry = next((e for e in data.get("pages", []) if int(e.get("page")) == int(page)), None)
     if not entry:
@@ -344,15 +585,22 @@ def api_curate_all(stem: str):
     json_path = _resolve_json_path(stem, name=name)
     if not json_path or not json_path.exists():
         return jsonify({"ok": False, "error": "mapping not found"}), 404
-    import json
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    count = 0
-    for e in data.get("pages", []):
-        if e.get("label") and e.get("label") != "Other":
-            _append_curated_record(data, e, json_path.name)
-            count += 1
-    return jsonify({"ok": True, "count": count})
+    data = _load_mapping(json_path)
+    entries = [e for e in data.get("pages", []) if e.get("label") and e.get("label") != "Other"]
+    if not entries:
+        return jsonify({"ok": True, "count": 0})
+    aliases = _load_aliases()
+    # Build the whole batch opening the source PDF once, then append it in one go
+    pdf_doc = None
+    if open_pdf is not None:
+        pdf_doc = open_pdf(SOURCE_DIR / data.get("document"))
+    try:
+        records = [_build_curated_record(data, e, json_path.name, aliases, pdf_doc=pdf_doc) for e in entries]
+    finally:
+        if pdf_doc is not None:
+            pdf_doc.close()
+    _append_curated_records(records)
+    return jsonify({"ok": True, "count": len(records)})
 
 
 @app.post("/api/label_alias_merge")
@@ -376,10 +624,269 @@ def api_label_alias_merge():
     return jsonify({"ok": True, "alias": alias, "canonical": canonical})
 
 
+# Line count of the curated index, keyed on the file identity it was computed for.
+# "dead" counts tombstoned lines (overwritten with a leading "#") so totals exclude them.
+_INDEX_COUNT = {"ino": -1, "size": -1, "count": 0, "dead": 0}
+# doc#page -> [(offset, length)] of every live line for that key, same keying as above
+_INDEX_OFFSETS = {"ino": -1, "size": -1, "keys": {}}
+# Serializes appends, tombstones and rewrites of the curated index across request threads
+_INDEX_LOCK = threading.RLock()
+# Long-lived append handle for the index; its 1 MiB buffer is flushed at the end of each
+# request and before anything reads, tombstones or rewrites the file
+_INDEX_WRITER = None
+
+
+def _index_writer():
+    global _INDEX_WRITER
+    w = _INDEX_WRITER
+    if w is not None and not w.closed:
+        try:
+            if os.fstat(w.fileno()).st_ino == DATASET_INDEX.stat().st_ino:
+                return w
+        except OSError:
+            pass
+        w.close()
+    DATASET_INDEX.parent.mkdir(parents=True, exist_ok=True)
+    _INDEX_WRITER = open(DATASET_INDEX, "ab", buffering=1 << 20)
+    return _INDEX_WRITER
+
+
+def _flush_index_writer() -> None:
+    with _INDEX_LOCK:
+        if _INDEX_WRITER is not None and not _INDEX_WRITER.closed:
+            _INDEX_WRITER.flush()
+
+
+def _close_index_writer() -> None:
+    global _INDEX_WRITER
+    with _INDEX_LOCK:
+        if _INDEX_WRITER is not None:
+            _INDEX_WRITER.close()
+            _INDEX_WRITER = None
+
+
+atexit.register(_close_index_writer)
+
+
+@app.after_request
+def _flush_index(resp):
+    _flush_index_writer()
+    return resp
+
+
+@app.after_request
+def _gzip_json(resp):
+    # Mapping and curated-list JSON compresses 5-10x; skip small, streamed,
+    # file-backed and already-encoded bodies
+    if (
+        resp.status_code != 200
+        or resp.mimetype != "application/json"
+        or resp.direct_passthrough
+        or resp.is_streamed
+        or "Content-Encoding" in resp.headers
+        or "gzip" not in request.headers.get("Accept-Encoding", "")
+    ):
+        return resp
+    data = resp.get_data()
+    if len(data) < 1024:
+        return resp
+    resp.set_data(gzip.compress(data, compresslevel=5))
+    resp.headers["Content-Encoding"] = "gzip"
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def _count_lines(path: Path, start: int = 0, block: int = 1 << 20) -> tuple[int, int]:
+    """Count (lines, tombstoned lines) from byte offset start, which must be a line boundary."""
+    lines = 0
+    dead = 0
+    with open(path, "rb") as f:
+        prev = b"\n"
+        if start > 0:
+            f.seek(start - 1)
+            prev = f.read(1)
+        while True:
+            chunk = f.read(block)
+            if not chunk:
+                break
+            lines += chunk.count(b"\n")
+            dead += (prev + chunk).count(b"\n#")
+            prev = chunk[-1:]
+    return lines, dead
+
+
+def _curated_count() -> int:
+    """Return the number of live (non-tombstoned) lines in the curated index.
+
+    Appends only count the newly written tail; a rewrite (new inode) or a
+    truncation triggers a full recount.
+    """
+    _flush_index_writer()
+    if not DATASET_INDEX.exists():
+        return 0
+    st = DATASET_INDEX.stat()
+    cache = _INDEX_COUNT
+    if cache["ino"] != st.st_ino or cache["size"] != st.st_size:
+        if cache["ino"] == st.st_ino and 0 <= cache["size"] < st.st_size:
+            lines, dead = _count_lines(DATASET_INDEX, start=cache["size"])
+            lines += cache["count"]
+            dead += cache["dead"]
+        else:
+            lines, dead = _count_lines(DATASET_INDEX)
+        cache.update(ino=st.st_ino, size=st.st_size, count=lines, dead=dead)
+    return cache["count"] - cache["dead"]
+
+
+def _scan_offsets(path: Path, start: int, keys: dict) -> None:
+    with open(path, "rb") as f:
+        f.seek(start)
+        off = start
+        for line in f:
+            n = len(line)
+            if line[:1] != b"#" and line.strip():
+                try:
+                    rec = orjson.loads(line)
+                    key = (rec.get("document"), int(rec.get("page", -1)))
+                    keys.setdefault(key, []).append((off, n))
+                except Exception:
+                    pass
+            off += n
+
+
+def _curated_offsets() -> dict:
+    """Return the in-memory (document, page) -> [(offset, length)] table for the index.
+
+    Built with one scan per process and extended incrementally when the file grows;
+    a rewrite or truncation rebuilds it.
+    """
+    _flush_index_writer()
+    state = _INDEX_OFFSETS
+    if not DATASET_INDEX.exists():
+        state.update(ino=-1, size=-1, keys={})
+        return state["keys"]
+    st = DATASET_INDEX.stat()
+    if state["ino"] != st.st_ino or state["size"] != st.st_size:
+        if state["ino"] == st.st_ino and 0 <= state["size"] < st.st_size:
+            _scan_offsets(DATASET_INDEX, state["size"], state["keys"])
+        else:
+            state["keys"] = {}
+            _scan_offsets(DATASET_INDEX, 0, state["keys"])
+        state.update(ino=st.st_ino, size=st.st_size)
+    return state["keys"]
+
+
+def _tombstone_curated(keys_to_drop, delete_images: bool = True, keep_images=frozenset()) -> int:
+    """Mark every live line for the given (document, page) keys as deleted in place.
+
+    The first byte of each line is overwritten with "#", which no JSON reader accepts,
+    so existing consumers skip it; api_curated_dedupe compacts tombstones away.
+    Image files listed in keep_images are not deleted. Returns the number of lines tombstoned.
+    """
+    with _INDEX_LOCK:
+        keys = _curated_offsets()
+        spans = [span for key in keys_to_drop for span in keys.pop(key, ())]
+        if not spans:
+            return 0
+        # Bring the line counter up to date first so the tombstones land in counted territory
+        _curated_count()
+        with open(DATASET_INDEX, "r+b") as f:
+            for off, n in spans:
+                if delete_images:
+                    f.seek(off)
+                    try:
+                        img = orjson.loads(f.read(n)).get("image_path")
+                        if img and img not in keep_images:
+                            Path(img).unlink(missing_ok=True)
+                    except Exception:
+                        pass
+                f.seek(off)
+                f.write(b"#")
+        _INDEX_COUNT["dead"] += len(spans)
+        return len(spans)
+
+
+def _append_curated_records(records: list[dict]) -> None:
+    """Append records to the index, superseding earlier lines for the same doc#page.
+
+    Prior lines for each key are tombstoned through the in-memory offset table
+    (no index scan), and the new lines' offsets are recorded as they are written.
+    """
+    keys = [(r.get("document"), int(r.get("page", -1))) for r in records]
+    with _INDEX_LOCK:
+        # The new records may reuse the same image paths; keep those files
+        _tombstone_curated(keys, delete_images=True, keep_images={r.get("image_path") for r in records})
+        offsets = _curated_offsets()
+        f = _index_writer()
+        for rec, key in zip(records, keys):
+            line = orjson.dumps(rec) + b"\n"
+            offsets.setdefault(key, []).append((f.tell(), len(line)))
+            f.write(line)
+        # Buffered bytes are flushed before the next stat-based check, so tell() is the size
+        _INDEX_OFFSETS.update(ino=os.fstat(f.fileno()).st_ino, size=f.tell())
+
+
+def _tail_window(
+    path: Path, n: int, end: int | None = None, block: int = 1 << 16, skip_tombstones: bool = True
+) -> tuple[list[bytes], int]:
+    """Return the last n live lines ending at byte offset end (default EOF).
+
+    Reads blocks backwards from end until n non-empty lines (not counting
+    tombstoned "#..." lines unless skip_tombstones is False) are found; also returns
+    the offset where the first returned line starts, usable as the next end for
+    keyset pagination (0 once the start of the file is reached).
+    """
+    if n <= 0:
+        return [], end if end is not None else path.stat().st_size
+    found: list[tuple[int, bytes]] = []
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        pos = size if end is None else max(0, min(end, size))
+        # Bytes after pos belonging to a line that starts in an earlier block
+        carry = b""
+        while pos > 0 and len(found) < n:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + carry
+            parts = buf.split(b"\n")
+            # Unless at the start of the file, the first piece may still be partial
+            carry = parts.pop(0) if pos > 0 else b""
+            line_end = pos + len(buf)
+            for ln in reversed(parts):
+                line_start = line_end - len(ln)
+                if ln.strip() and not (skip_tombstones and ln[:1] == b"#"):
+                    found.append((line_start, ln))
+                    if len(found) == n:
+                        break
+                line_end = line_start - 1
+    # Fewer than n lines means the scan reached the start of the file
+    start = found[-1][0] if len(found) == n else 0
+    return [ln for _off, ln in reversed(found)], start
+
+
+def _tail_lines(path: Path, n: int, block: int = 1 << 16) -> list[bytes]:
+    """Return the last n non-empty lines of path, reading blocks backwards from the end."""
+    return _tail_window(path, n, block=block, skip_tombstones=False)[0]
+
+
 @app.route("/curated")
 def curated():
+    """List the most recent curated records.
+
+    Query: limit (default 50, max 200) and before (byte offset returned as
+    next_before by the previous page) for keyset pagination.
+    """
     total = 0
     items = []
+    next_before = None
+    try:
+        limit = max(1, min(int(request.args.get("limit", 50)), 200))
+    except Exception:
+        limit = 50
+    try:
+        before = int(request.args["before"]) if request.args.get("before") else None
+    except Exception:
+        before = None
     # List embedding/index versions
     faiss_dir = ROOT / "dataset" / "v2" / "faiss"
     emb_dir = ROOT / "dataset" / "v2" / "embeddings"
@@ -392,73 +899,51 @@ def curated():
         except Exception:
             active_ver = None
     # Detect versions by scanning embeddings jsonl
-    import re
     for p in sorted(emb_dir.glob("clip_vitb32*.jsonl")):
-        m = re.match(r"clip_vitb32(?:_(v\d+))?\.jsonl$", p.name)
+        m = _EMB_FILE_RE.match(p.name)
         if m:
             ver = m.group(1) or "default"
             versions.append(ver)
     if DATASET_INDEX.exists():
-        from collections import deque
-        import json
-        dq = deque(maxlen=200)
-        with open(DATASET_INDEX, "r", encoding="utf-8") as f:
-            for line in f:
-                total += 1
-                dq.append(line)
-        for line in dq:
+        total = _curated_count()  # also flushes pending appends
+        lines, start = _tail_window(DATASET_INDEX, limit, end=before)
+        for line in lines:
             try:
-                rec = json.loads(line)
+                rec = orjson.loads(line)
                 items.append(rec)
             except Exception:
                 continue
-    return render_template("curated.html", total=total, items=items, versions=versions, active_ver=active_ver)
+        if start > 0:
+            next_before = start
+    return render_template(
+        "curated.html",
+        total=total,
+        items=items,
+        versions=versions,
+        active_ver=active_ver,
+        limit=limit,
+        next_before=next_before,
+    )
 
 
 def _delete_curated_records(doc: str, page: int | None = None, delete_images: bool = True) -> dict:
-    """Filter out curated records for a given doc (and page if provided).
+    """Remove curated records for a given doc (and page if provided).
 
     Returns stats: {deleted, kept}. Also deletes image files when available and delete_images is True.
     """
-    import json
-    import os
-    from tempfile import NamedTemporaryFile
+    if page is None:
+        keys = [k for k in _curated_offsets() if k[0] == doc]
+    else:
+        keys = [(doc, int(page))]
+    return _delete_curated_records_bulk(keys, delete_images=delete_images)
+
 
+def _delete_curated_records_bulk(pairs, delete_images: bool = True) -> dict:
+    """Remove every curated record whose (document, page) is in pairs."""
     if not DATASET_INDEX.exists():
         return {"deleted": 0, "kept": 0}
-
-    deleted = 0
-    kept = 0
-    with open(DATASET_INDEX, "r", encoding="utf-8") as src, NamedTemporaryFile("w", delete=False, dir=str(DATASET_INDEX.parent), encoding="utf-8") as tmp:
-        tmp_path = Path(tmp.name)
-        for line in src:
-            line_s = line.strip()
-            if not line_s:
-                continue
-            try:
-                rec = json.loads(line_s)
-            except Exception:
-                # keep unparsable lines
-                tmp.write(line)
-                kept += 1
-                continue
-            if rec.get("document") == doc and (page is None or int(rec.get("page", -1)) == int(page)):
-                deleted += 1
-                # Best-effort delete image
-                if delete_images:
-                    img = rec.get("image_path")
-                    if img:
-                        try:
-                            Path(img).unlink(missing_ok=True)
-                        except Exception:
-                            pass
-                continue
-            # keep
-            tmp.write(json.dumps(rec, ensure_ascii=False) + "\n")
-            kept += 1
-    # Atomic replace
-    os.replace(tmp_path, DATASET_INDEX)
-    return {"deleted": deleted, "kept": kept}
+    deleted = _tombstone_curated(pairs, delete_images=delete_images)
+    return {"deleted": deleted, "kept": _curated_count()}
 
 
 @app.post("/api/curated_delete")
@@ -489,24 +974,58 @@ def api_curated_delete():
     return jsonify({"ok": True, **stats})
 
 
+# Background build jobs by id ("embeddings_v3", "index_v3"); output goes to a log file
+_BUILD_JOBS: dict[str, dict] = {}
+# Held across the running-job checks, the version pick and the Popen so two requests
+# can't launch the same job or pick the same version; re-entrant for api_build_embeddings
+_BUILD_LOCK = threading.RLock()
+BUILD_LOGS = ROOT / "dataset" / "v2" / "logs"
+
+
+def _job_running(job_id: str) -> bool:
+    job = _BUILD_JOBS.get(job_id)
+    return job is not None and job["proc"].poll() is None
+
+
+def _start_build_job(kind: str, ver: str, script: str, args=()):
+    """Launch a curation script without blocking the request; returns (job_id, error)."""
+    job_id = f"{kind}_{ver}"
+    with _BUILD_LOCK:
+        if _job_running(job_id):
+            return job_id, "already running"
+        # The build scripts read v2.jsonl directly
+        _flush_index_writer()
+        BUILD_LOGS.mkdir(parents=True, exist_ok=True)
+        log_path = BUILD_LOGS / f"{job_id}.log"
+        cmd = [sys.executable, str(ROOT / "curation" / script), "--version", ver, *args]
+        with open(log_path, "wb") as log:
+            proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, cwd=str(ROOT))
+        _BUILD_JOBS[job_id] = {"kind": kind, "version": ver, "proc": proc, "log": log_path}
+    return job_id, None
+
+
 @app.post("/api/build_embeddings")
 def api_build_embeddings():
-    # Compute next version vN based on existing files
+    # Compute next version vN based on existing files and builds still in flight
     emb_dir = ROOT / "dataset" / "v2" / "embeddings"
     emb_dir.mkdir(parents=True, exist_ok=True)
-    import re, subprocess
-    max_n = 0
-    for p in emb_dir.glob("clip_vitb32_*.jsonl"):
-        m = re.match(r"clip_vitb32_v(\d+)\.jsonl$", p.name)
-        if m:
-            max_n = max(max_n, int(m.group(1)))
-    ver = f"v{max_n+1}"
-    cmd = [sys.executable, str((ROOT / "curation" / "build_embeddings.py")), "--version", ver]
     try:
-        subprocess.run(cmd, check=True)
-        return jsonify({"ok": True, "version": ver})
+        with _BUILD_LOCK:
+            max_n = 0
+            for p in emb_dir.glob("clip_vitb32_*.jsonl"):
+                m = _EMB_VERSION_RE.match(p.name)
+                if m:
+                    max_n = max(max_n, int(m.group(1)))
+            for job in _BUILD_JOBS.values():
+                if job["kind"] == "embeddings" and job["proc"].poll() is None:
+                    max_n = max(max_n, int(job["version"].lstrip("v") or 0))
+            ver = f"v{max_n+1}"
+            job_id, err = _start_build_job("embeddings", ver, "build_embeddings.py")
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
+    if err:
+        return jsonify({"ok": False, "error": err, "job": job_id}), 409
+    return jsonify({"ok": True, "version": ver, "job": job_id})
 
 
 @app.post("/api/build_index")
@@ -514,13 +1033,41 @@ def api_build_index():
     ver = request.form.get("version") or request.args.get("version")
     if not ver:
         return jsonify({"ok": False, "error": "version required"}), 400
-    import subprocess
-    cmd = [sys.executable, str((ROOT / "curation" / "build_faiss.py")), "--version", ver]
+    index_type = request.form.get("index_type") or request.args.get("index_type") or "flat"
+    if index_type not in ("flat", "hnsw", "sq8", "ivfpq"):
+        return jsonify({"ok": False, "error": "index_type must be flat, hnsw, sq8 or ivfpq"}), 400
     try:
-        subprocess.run(cmd, check=True)
-        return jsonify({"ok": True, "version": ver})
+        with _BUILD_LOCK:
+            # build_faiss.py would read a half-written embeddings file
+            if _job_running(f"embeddings_{ver}"):
+                return jsonify({"ok": False, "error": "embeddings still building", "job": f"embeddings_{ver}"}), 409
+            job_id, err = _start_build_job("index", ver, "build_faiss.py", ("--index-type", index_type))
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
+    if err:
+        return jsonify({"ok": False, "error": err, "job": job_id}), 409
+    return jsonify({"ok": True, "version": ver, "job": job_id})
+
+
+@app.get("/api/build_status/<job_id>")
+def api_build_status(job_id: str):
+    """Report a build job's state: running, or finished with its exit code, plus the log tail."""
+    job = _BUILD_JOBS.get(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "unknown job"}), 404
+    code = job["proc"].poll()
+    try:
+        tail = b"\n".join(_tail_lines(job["log"], 20)).decode("utf-8", "replace")
+    except Exception:
+        tail = ""
+    return jsonify({
+        "ok": True,
+        "job": job_id,
+        "version": job["version"],
+        "running": code is None,
+        "returncode": code,
+        "output": tail,
+    })
 
 
 @app.post("/api/set_active_version")
@@ -539,14 +1086,14 @@ def api_build_manifest_splits():
     # Compute next vN
     man_dir = ROOT / "dataset" / "v2" / "manifests"
     man_dir.mkdir(parents=True, exist_ok=True)
-    import re, subprocess
     max_n = 0
     for p in man_dir.glob("v*.json"):
-        m = re.match(r"v(\d+)\.json$", p.name)
+        m = _MANIFEST_VERSION_RE.match(p.name)
         if m:
             max_n = max(max_n, int(m.group(1)))
     ver = f"v{max_n+1}"
     cmd = [sys.executable, str((ROOT / "curation" / "build_manifest_splits.py")), "--version", ver]
+    _flush_index_writer()
     try:
         subprocess.run(cmd, check=True)
         return jsonify({"ok": True, "version": ver})
@@ -558,24 +1105,47 @@ def _delete_all_curated(delete_images: bool = True) -> dict:
     """Delete all curated records (and optionally all curated images)."""
     total = 0
     if DATASET_INDEX.exists():
-        # Count lines then truncate file
-        with open(DATASET_INDEX, "r", encoding="utf-8") as f:
-            for _ in f:
-                total += 1
-        # Truncate
-        open(DATASET_INDEX, "w", encoding="utf-8").close()
+        with _INDEX_LOCK:
+            total = _curated_count()
+            _close_index_writer()
+            # Truncate
+            open(DATASET_INDEX, "w", encoding="utf-8").close()
+            # Same inode, so the caches would otherwise resume counting/scanning
+            # from the old size, which is not a line boundary in the new file
+            st = DATASET_INDEX.stat()
+            _INDEX_COUNT.update(ino=st.st_ino, size=0, count=0, dead=0)
+            _INDEX_OFFSETS.update(ino=st.st_ino, size=0, keys={})
     images_deleted = 0
     if delete_images and DATASET_IMAGES.exists():
-        for p in DATASET_IMAGES.rglob("*"):
-            try:
-                if p.is_file():
-                    p.unlink()
-                    images_deleted += 1
-            except Exception:
-                pass
+        images_deleted = _unlink_files_under(str(DATASET_IMAGES))
     return {"deleted": total, "images_deleted": images_deleted}
 
 
+def _unlink_files_under(root: str) -> int:
+    """Delete every file below root (directories are kept); returns the number removed.
+
+    scandir exposes each entry's type from the directory read, so no per-file stat is needed.
+    """
+    removed = 0
+    stack = [root]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for ent in it:
+                try:
+                    if ent.is_dir(follow_symlinks=False):
+                        stack.append(ent.path)
+                    elif ent.is_file():
+                        os.unlink(ent.path)
+                        removed += 1
+                except OSError:
+                    pass
+    return removed
+
+
 @app.post("/api/curated_delete_all")
 def api_curated_delete_all():
     delete_images = request.args.get("delete_images", "1") in ("1", "true", "True")
@@ -585,41 +1155,53 @@ def api_curated_delete_all():
 
 @app.post("/api/curated_dedupe")
 def api_curated_dedupe():
-    """Deduplicate curated index by keeping the last entry per document#page."""
-    import json
-    from tempfile import NamedTemporaryFile
+    """Deduplicate curated index by keeping the last entry per document#page.
+
+    Also compacts away lines tombstoned by deletes.
+    """
     if not DATASET_INDEX.exists():
         return jsonify({"ok": True, "deleted": 0, "kept": 0})
-    # First pass: find last index per id
+    with _INDEX_LOCK:
+        stats = _compact_curated_index()
+    return jsonify({"ok": True, **stats})
+
+
+def _compact_curated_index() -> dict:
+    # The rewrite swaps in a new file; drop the handle on the old one
+    _close_index_writer()
+    # Single parse pass: remember each line's key and the last index per key
     positions = {}
     lines = []
+    keys = []
     with open(DATASET_INDEX, "r", encoding="utf-8") as f:
         for idx, line in enumerate(f):
             lines.append(line)
+            key = None
+            if line.startswith("#"):
+                # tombstone: dropped on rewrite
+                keys.append(False)
+                continue
             try:
-                rec = json.loads(line)
-                key = f"{rec.get('document')}#{int(rec.get('page', -1))}"
+                rec = orjson.loads(line)
+                key = (rec.get("document"), int(rec.get("page", -1)))
                 positions[key] = idx
             except Exception:
                 pass
-    # Second pass: write only lines whose idx equals last position
+            keys.append(key)
+    # Write only lines whose idx equals last position (unparsable lines are kept)
     kept = 0
     with NamedTemporaryFile("w", delete=False, dir=str(DATASET_INDEX.parent), encoding="utf-8") as tmp:
         tmp_path = Path(tmp.name)
         for idx, line in enumerate(lines):
-            try:
-                rec = json.loads(line)
-                key = f"{rec.get('document')}#{int(rec.get('page', -1))}"
-                if positions.get(key) == idx:
-                    tmp.write(line)
-                    kept += 1
-            except Exception:
-                # keep unparsable lines
+            key = keys[idx]
+            if key is False:
+                continue
+            if key is None or positions.get(key) == idx:
                 tmp.write(line)
                 kept += 1
     deleted = len(lines) - kept
     os.replace(tmp_path, DATASET_INDEX)
-    return jsonify({"ok": True, "deleted": deleted, "kept": kept})
+    return {"deleted": deleted, "kept": kept}
 
 
 @app.route("/help")
@@ -633,32 +1215,27 @@ def api_suggest(stem: str, page: int):
 
     Requires FAISS index built (Step 5). If unavailable, returns 501.
     """
-    try:
-        from curation.suggest import embed_pdf_page, search_neighbors
-    except Exception:
+    if embed_pdf_page is None:
         return jsonify({"ok": False, "error": "suggestion engine not available"}), 501
 
     name = request.args.get("name")
     json_path = _resolve_json_path(stem, name=name)
     if not json_path or not json_path.exists():
         return jsonify({"ok": False, "error": "mapping not found"}), 404
-    import json as _json
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = _json.load(f)
+    data = _load_mapping(json_path)
     pdf_path = SOURCE_DIR / data.get("document")
     if not pdf_path.exists():
         return jsonify({"ok": False, "error": "source PDF not found"}), 404
-    # Fetch auto_label for this page (if available) and canonicalize for use as a prior
-    page_entry = None
+    # Index page entries once (first entry wins) for the current/previous page lookups
+    by_page: dict[int, dict] = {}
     for e in data.get("pages", []):
         try:
-            if int(e.get("page")) == int(page):
-                page_entry = e
-                break
+            by_page.setdefault(int(e.get("page")), e)
         except Exception:
             continue
+    # Fetch auto_label for this page (if available) and canonicalize for use as a prior
+    page_entry = by_page.get(int(page))
     try:
-        from curation.rerank import rerank_suggestions
         q = embed_pdf_page(pdf_path, page)
         results = search_neighbors(ROOT, q, topk=10)
         aliases = _load_aliases()
@@ -667,13 +1244,7 @@ def api_suggest(stem: str, page: int):
         if page_entry is not None:
             prev_page = int(page_entry.get("page", 0)) - 1
             if prev_page > 0:
-                for e in data.get("pages", []):
-                    try:
-                        if int(e.get("page")) == prev_page:
-                            prev_entry = e
-                            break
-                    except Exception:
-                        continue
+                prev_entry = by_page.get(prev_page)
         merged = rerank_suggestions(results, page_entry, prev_entry, aliases, topk=5)
         return jsonify({"ok": True, "results": merged})
     except Exception as e:
@@ -682,7 +1253,6 @@ def api_suggest(stem: str, page: int):
 
 if __name__ == "__main__":
     # Bind to configurable host/port to avoid conflicts (e.g., AirPlay using 5000)
-    import os
     host = os.environ.get("HOST", "0.0.0.0")
     port = int(os.environ.get("PORT", "5000"))
     app.run(host=host, port=port, debug=True)
@@ -4,8 +4,11 @@ from __future__ import annotations
 import argparse
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import requests
+from typing import List
+
+from _http import SESSION as _SESSION
 
 
 def _endpoint_and_key():
@@ -40,32 +43,57 @@ def analyze_file(classifier_id: str, file_path: Path, content_type: str = "image
     # Try classifier endpoint first
     url_cls = f"{endpoint}/formrecognizer/documentClassifiers/{classifier_id}:analyze?api-version=2023-07-31"
     headers = _auth_headers(key, content_type)
+    # Stream the file body (requests sets Content-Length from the handle)
     with open(file_path, "rb") as f:
-        data = f.read()
-    resp = requests.post(url_cls, headers=headers, data=data, timeout=120)
-    if resp.status_code == 404:
-        # Some resources expose models instead of classifiers; try documentModels
-        url_model = f"{endpoint}/formrecognizer/documentModels/{classifier_id}:analyze?api-version=2023-07-31"
-        # For models, octet-stream is safest
-        headers2 = _auth_headers(key, "application/octet-stream")
-        resp2 = requests.post(url_model, headers=headers2, data=data, timeout=120)
-        resp2.raise_for_status()
-        return resp2.json()
+        resp = _SESSION.post(url_cls, headers=headers, data=f, timeout=120)
+        if resp.status_code == 404:
+            # Some resources expose models instead of classifiers; try documentModels
+            url_model = f"{endpoint}/formrecognizer/documentModels/{classifier_id}:analyze?api-version=2023-07-31"
+            # For models, octet-stream is safest
+            headers2 = _auth_headers(key, "application/octet-stream")
+            f.seek(0)
+            resp2 = _SESSION.post(url_model, headers=headers2, data=f, timeout=120)
+            resp2.raise_for_status()
+            return resp2.json()
     resp.raise_for_status()
     return resp.json()
 
 
+def analyze_files(classifier_id: str, file_paths: List[Path], content_type: str = "image/png", concurrency: int = 8) -> List[dict]:
+    """Analyze many pages concurrently over the shared session; results keep input order.
+
+    Requests are network-latency bound, so up to `concurrency` run in flight at once
+    (bounded by the session's connection pool). A failed page yields {"error": ...}
+    instead of aborting the batch.
+    """
+    def _one(p: Path) -> dict:
+        try:
+            return analyze_file(classifier_id, p, content_type)
+        except Exception as e:
+            return {"error": str(e), "file": str(p)}
+
+    if len(file_paths) <= 1:
+        return [_one(p) for p in file_paths]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        return list(ex.map(_one, file_paths))
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--classifier-id", help="If omitted, uses AZURE_DOC_AI_CLASSIFIER_ID or azure_classifier_id from .env")
-    ap.add_argument("--file", required=True, help="Path to single-page PNG/JPG/PDF")
+    ap.add_argument("--file", required=True, nargs="+", help="Path(s) to single-page PNG/JPG/PDF")
     ap.add_argument("--content-type", default="image/png")
+    ap.add_argument("--concurrency", type=int, default=8, help="Parallel requests when several files are given")
     args = ap.parse_args()
     cid = args.classifier_id or os.environ.get("AZURE_DOC_AI_CLASSIFIER_ID") or os.environ.get("azure_classifier_id")
     if not cid:
         raise SystemExit("Provide --classifier-id or set AZURE_DOC_AI_CLASSIFIER_ID / azure_classifier_id in .env")
-    result = analyze_file(cid, Path(args.file), args.content_type)
-    print(result)
+    if len(args.file) == 1:
+        result = analyze_file(cid, Path(args.file[0]), args.content_type)
+        print(result)
+        return
+    for p, result in zip(args.file, analyze_files(cid, [Path(p) for p in args.file], args.content_type, args.concurrency)):
+        print(p, result)
 
 
 if __name__ == "__main__":
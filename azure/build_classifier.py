@@ -7,8 +7,9 @@ import sys
 from pathlib import Path
 from typing import List, Dict
 from urllib.parse import urlparse, urlunparse
-import requests
-import json
+import orjson
+
+from _http import SESSION as _SESSION
 
 
 def _endpoint_and_key():
@@ -29,23 +30,24 @@ def _endpoint_and_key():
     return ep.rstrip("/"), key
 
 
-def _labels_from_jsonl(index_path: Path) -> List[str]:
-    labels = []
-    seen = set()
-    with open(index_path, "r", encoding="utf-8") as f:
+def _iter_records(index_path: Path):
+    with open(index_path, "rb") as f:
         for line in f:
-            line = line.strip()
-            if not line:
+            # Skip tombstoned ("#...") and empty lines without parsing them
+            if line[:1] in (b"#", b"\n"):
                 continue
             try:
-                rec = json.loads(line)
-            except Exception:
+                rec = orjson.loads(line)
+            except orjson.JSONDecodeError:
                 continue
-            lbl = rec.get("label")
-            if lbl and lbl not in seen and lbl != "Other":
-                seen.add(lbl)
-                labels.append(lbl)
-    return labels
+            if isinstance(rec, dict):
+                yield rec
+
+
+def _labels_from_jsonl(index_path: Path) -> List[str]:
+    # Ordered dedupe in one pass: dict.fromkeys keeps first-seen order
+    labels = (r.get("label") for r in _iter_records(index_path))
+    return list(dict.fromkeys(lbl for lbl in labels if lbl and lbl != "Other"))
 
 
 def _join_folder_sas(base_url: str, folder: str) -> str:
@@ -68,7 +70,7 @@ def build_classifier(classifier_id: str, container_sas_base: str, labels: List[s
         "docTypes": doc_types,
     }
     headers = {"Ocp-Apim-Subscription-Key": key, "Content-Type": "application/json"}
-    resp = requests.post(url, headers=headers, json=payload, timeout=60)
+    resp = _SESSION.post(url, headers=headers, json=payload, timeout=60)
     resp.raise_for_status()
     # Operation-Location header contains status URL; return both
     return {"status": resp.status_code, "operation": resp.headers.get("Operation-Location"), "body": resp.json() if resp.content else {}}
@@ -90,7 +92,7 @@ def main():
         raise SystemExit("No labels found. Provide --labels-file or ensure curated index has labels.")
 
     res = build_classifier(args.classifier_id, args.container_sas_base, labels)
-    print(json.dumps(res, indent=2))
+    print(orjson.dumps(res, option=orjson.OPT_INDENT_2).decode("utf-8"))
 
 
 if __name__ == "__main__":
@@ -2,58 +2,98 @@
 from __future__ import annotations
 
 import argparse
-import json
+import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import orjson
 
-def load_rows(index_path: Path):
-    rows = []
-    with open(index_path, "r", encoding="utf-8") as f:
+
+def _iter_records(index_path: Path):
+    with open(index_path, "rb") as f:
         for line in f:
-            line = line.strip()
-            if not line:
+            # Tombstoned ("#...") and empty lines are rejected on the first byte;
+            # anything else unparsable falls out of orjson
+            if line[:1] in (b"#", b"\n"):
                 continue
             try:
-                rows.append(json.loads(line))
-            except Exception:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError:
                 continue
-    # Deduplicate by doc#page keep last
+
+
+def load_rows(index_path: Path):
+    # Parse and deduplicate by (document, page) in one streaming pass, keep last
     by_id = {}
-    for r in rows:
+    for r in _iter_records(index_path):
         try:
-            ident = f"{r.get('document')}#{int(r.get('page'))}"
-        except Exception:
+            by_id[(r.get("document"), int(r.get("page")))] = r
+        except (AttributeError, TypeError, ValueError):
             continue
-        by_id[ident] = r
     return list(by_id.values())
 
 
-def export_tree(index_path: Path, out_root: Path, max_per_label: int | None = None):
+def _link_or_copy(src: Path, dst: Path, mode: str) -> bool:
+    """Place src at dst: hardlink or reflink when asked and possible, else a plain copy."""
+    try:
+        # Never write through an earlier export's hardlink into the dataset image
+        dst.unlink(missing_ok=True)
+    except OSError:
+        return False
+    if mode in ("link", "reflink"):
+        try:
+            if mode == "link":
+                os.link(src, dst)
+            else:
+                import reflink  # type: ignore
+                reflink.reflink(str(src), str(dst))
+            return True
+        except Exception:
+            # Cross-device, unsupported filesystem or missing reflink package
+            pass
+    try:
+        shutil.copyfile(src, dst)
+        return True
+    except Exception:
+        return False
+
+
+def export_tree(index_path: Path, out_root: Path, max_per_label: int | None = None, mode: str = "link"):
     rows = load_rows(index_path)
     out_root.mkdir(parents=True, exist_ok=True)
-    per_label = {}
-    copied = 0
+    candidates = {}
     for r in rows:
         lbl = r.get("label")
         img = r.get("image_path")
         if not lbl or not img:
             continue
-        if max_per_label is not None and per_label.get(lbl, 0) >= max_per_label:
-            continue
         src = Path(img)
         if not src.exists():
             continue
-        dst_dir = out_root / lbl
-        dst_dir.mkdir(parents=True, exist_ok=True)
-        dst = dst_dir / src.name
-        try:
-            shutil.copy2(src, dst)
-            per_label[lbl] = per_label.get(lbl, 0) + 1
-            copied += 1
-        except Exception:
-            continue
-    return copied, per_label
+        candidates.setdefault(lbl, []).append((src, out_root / lbl / src.name))
+    # One mkdir per label instead of one per image
+    for lbl in candidates:
+        (out_root / lbl).mkdir(parents=True, exist_ok=True)
+    per_label = {lbl: 0 for lbl in candidates}
+    pos = {lbl: 0 for lbl in candidates}
+    # Threads overlap the per-file syscalls; links are O(1) but copies are I/O bound.
+    # Each round only tops labels up to the cap, so failed files are replaced by
+    # later candidates and only completed placements count against --max-per-label.
+    with ThreadPoolExecutor(max_workers=16) as ex:
+        while True:
+            jobs = []
+            for lbl, cands in candidates.items():
+                need = len(cands) if max_per_label is None else max_per_label - per_label[lbl]
+                take = cands[pos[lbl]:pos[lbl] + max(need, 0)]
+                pos[lbl] += len(take)
+                jobs.extend((lbl, src, dst) for src, dst in take)
+            if not jobs:
+                break
+            for (lbl, _src, _dst), done in zip(jobs, ex.map(lambda j: _link_or_copy(j[1], j[2], mode), jobs)):
+                if done:
+                    per_label[lbl] += 1
+    return sum(per_label.values()), {lbl: n for lbl, n in per_label.items() if n}
 
 
 def main():
@@ -61,9 +101,11 @@ def main():
     ap.add_argument("--index-jsonl", default=str(Path(__file__).resolve().parents[1] / "dataset" / "v2" / "index" / "v2.jsonl"))
     ap.add_argument("--out", required=True, help="Output root that will contain one folder per label")
     ap.add_argument("--max-per-label", type=int, help="Optional cap per label (e.g., 500)")
+    ap.add_argument("--mode", choices=["link", "reflink", "copy"], default="link",
+                    help="How to place images; link/reflink fall back to copying when unsupported")
     args = ap.parse_args()
 
-    copied, per_label = export_tree(Path(args.index_jsonl), Path(args.out), args.max_per_label)
+    copied, per_label = export_tree(Path(args.index_jsonl), Path(args.out), args.max_per_label, args.mode)
     print(f"Copied {copied} images")
     for lbl, n in sorted(per_label.items(), key=lambda kv: kv[0]):
         print(f"{lbl}: {n}")
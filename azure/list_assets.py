@@ -3,8 +3,10 @@ from __future__ import annotations
 
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import requests
+
+from _http import SESSION as _SESSION
 
 
 def _endpoint_and_key():
@@ -31,14 +33,19 @@ def main():
         ("classifiers", f"{ep}/formrecognizer/documentClassifiers?api-version=2023-07-31"),
         ("models", f"{ep}/formrecognizer/documentModels?api-version=2023-07-31"),
     ]
-    out = {}
-    for name, url in urls:
+
+    def _fetch(url):
         try:
-            r = requests.get(url, headers=h, timeout=30)
+            r = _SESSION.get(url, headers=h, timeout=30)
             r.raise_for_status()
-            out[name] = r.json()
+            return r.json()
         except Exception as e:
-            out[name] = {"error": str(e)}
+            return {"error": str(e)}
+
+    # Both listings in flight at once: one Azure round trip instead of two
+    with ThreadPoolExecutor(max_workers=len(urls)) as ex:
+        futs = {name: ex.submit(_fetch, url) for name, url in urls}
+        out = {name: f.result() for name, f in futs.items()}
     print(json.dumps(out, indent=2))
 
 
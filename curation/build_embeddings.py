@@ -1,31 +1,39 @@
 from __future__ import annotations
 
-import json
+import os
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List
+from typing import Iterator, List
 import argparse
 
+import numpy as np
+import orjson
 
-def _load_records(index_path: Path) -> List[dict]:
-    rows: List[dict] = []
-    with open(index_path, "r", encoding="utf-8") as f:
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, concurrent builds are unsafe there
+    fcntl = None
+
+
+def _iter_records(index_path: Path) -> Iterator[dict]:
+    """Stream parsed records from the curated JSONL, skipping blank, deleted and unparsable lines."""
+    with open(index_path, "rb") as f:
         for line in f:
-            line = line.strip()
-            if not line:
+            # Tombstoned ("#...") and empty lines are rejected on the first byte;
+            # anything else unparsable falls out of orjson
+            if line[:1] in (b"#", b"\n"):
                 continue
             try:
-                rows.append(json.loads(line))
-            except Exception:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError:
                 continue
-    return rows
 
 
 def _load_aliases(root: Path) -> dict:
     p = root / "dataset" / "v2" / "aliases.json"
     try:
         if p.exists():
-            with open(p, "r", encoding="utf-8") as f:
-                return json.load(f)
+            return orjson.loads(p.read_bytes())
     except Exception:
         pass
     return {}
@@ -40,30 +48,169 @@ def _ensure_open_clip():
         raise SystemExit("open_clip_torch/torch not installed. Add to requirements and install.") from e
 
 
-def _load_model(device: str = "cpu"):
+def _pick_device(torch) -> str:
+    if torch.cuda.is_available():
+        return "cuda"
+    mps = getattr(torch.backends, "mps", None)
+    if mps is not None and mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def _load_model(device: str | None = None):
     open_clip, torch = _ensure_open_clip()
+    device = device or _pick_device(torch)
     model, _, preprocess = open_clip.create_model_and_transforms(
         "ViT-B-32", pretrained="laion2b_s34b_b79k"
     )
     model = model.eval().to(device)
     tokenizer = open_clip.get_tokenizer("ViT-B-32")
-    return model, preprocess, tokenizer, torch
+    return model, preprocess, tokenizer, torch, device
+
+
+def _split_preprocess(preprocess):
+    """Split open_clip's transform into its PIL resize/crop steps, the crop size and
+    Normalize's mean/std, so pixels can be cached as uint8 and normalized on device."""
+    from torchvision import transforms as T
+
+    steps = list(preprocess.transforms)
+    names = [type(t).__name__ for t in steps]
+    norm = steps[names.index("Normalize")]
+    crop = steps[names.index("CenterCrop")].size if "CenterCrop" in names else (224, 224)
+    if isinstance(crop, int):
+        crop = (crop, crop)
+    return T.Compose(steps[:names.index("ToTensor")]), tuple(crop), tuple(norm.mean), tuple(norm.std)
+
+
+class _ImageDataset:
+    """Map-style dataset for DataLoader: decodes, resizes and crops one image per item,
+    returning uint8 CHW pixels."""
+
+    def __init__(self, paths: List[Path], transform):
+        self.paths = paths
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, i):
+        from PIL import Image
+
+        try:
+            img = self.transform(Image.open(self.paths[i]).convert("RGB"))
+        except OSError:
+            return None
+        return i, np.ascontiguousarray(np.asarray(img, dtype=np.uint8).transpose(2, 0, 1))
+
+
+def _collate(batch):
+    # Unreadable images come back as None; drop them from the batch
+    batch = [b for b in batch if b is not None]
+    return [i for i, _ in batch], [a for _, a in batch]
+
 
+class _PreprocCache:
+    """Append-only uint8 store of resized/cropped page images, one fixed-size slot per
+    document#page. Reruns (new version tags) read unchanged images straight from the
+    memmap instead of decoding and resizing the PNGs again.
 
-def _embed_image(path: Path, model, preprocess, torch):
-    from PIL import Image
+    Entries are {id: [slot, image_path, mtime_ns, size]}; a changed image gets a new
+    slot and the old one is left behind until --rebuild-cache.
+    """
 
-    img = Image.open(path).convert("RGB")
-    with torch.no_grad():
-        image = preprocess(img).unsqueeze(0)
-        feats = model.encode_image(image)
-        feats = feats / feats.norm(dim=-1, keepdim=True)
-    return feats.squeeze(0).cpu().numpy()
+    def __init__(self, cache_dir: Path, shape, rebuild: bool = False):
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.data_path = cache_dir / "preproc_cache.u8"
+        self.meta_path = cache_dir / "preproc_cache.json"
+        self.lock_path = cache_dir / "preproc_cache.lock"
+        self.shape = tuple(shape)
+        self.item_bytes = int(np.prod(self.shape))
+        with self._locked():
+            meta = None if rebuild else self._read_meta()
+            if meta is None:
+                self.data_path.write_bytes(b"")
+                self.entries = {}
+            else:
+                self.entries = meta
+
+    @contextmanager
+    def _locked(self):
+        # Concurrent builds (one per version tag) share this cache; serialize writers
+        with open(self.lock_path, "ab") as lf:
+            if fcntl is not None:
+                fcntl.flock(lf, fcntl.LOCK_EX)
+            yield
+
+    def _read_meta(self) -> dict | None:
+        """Entries from disk, or None when the cache is missing or was built for another shape."""
+        if not (self.meta_path.exists() and self.data_path.exists()):
+            return None
+        try:
+            meta = orjson.loads(self.meta_path.read_bytes())
+        except orjson.JSONDecodeError:
+            return None
+        if tuple(meta.get("shape", ())) != self.shape:
+            return None
+        # Drop slots past the end of the data file (e.g. an interrupted append)
+        n = self.data_path.stat().st_size // self.item_bytes
+        return {k: e for k, e in meta.get("entries", {}).items() if e[0] < n}
+
+    def slot(self, ident: str, sig: list) -> int | None:
+        e = self.entries.get(ident)
+        return e[0] if e and e[1:] == sig else None
+
+    def append(self, items) -> None:
+        """Write (ident, sig, uint8 array) items to new slots, then persist the index.
+
+        The lock is held across both steps and the index is re-read under it, so slots
+        another build appended meanwhile are neither overwritten nor dropped from the meta.
+        """
+        with self._locked():
+            self.entries = self._read_meta() or {}
+            with open(self.data_path, "r+b") as f:
+                # Trim a partial trailing item so new slots stay aligned
+                next_slot = os.fstat(f.fileno()).st_size // self.item_bytes
+                f.truncate(next_slot * self.item_bytes)
+                f.seek(0, os.SEEK_END)
+                for ident, sig, arr in items:
+                    f.write(arr.tobytes())
+                    self.entries[ident] = [next_slot, *sig]
+                    next_slot += 1
+            tmp = self.meta_path.with_suffix(".json.tmp")
+            tmp.write_bytes(orjson.dumps({"shape": list(self.shape), "entries": self.entries}))
+            os.replace(tmp, self.meta_path)
+
+    def open(self) -> np.ndarray | None:
+        n = self.data_path.stat().st_size // self.item_bytes
+        if not n:
+            return None
+        return np.memmap(self.data_path, dtype=np.uint8, mode="r", shape=(n, *self.shape))
+
+
+def _embed_images(images, model, torch, device: str = "cpu"):
+    """Embed a preprocessed [N, 3, H, W] batch with one encode_image call; returns an [N, D] array."""
+    from contextlib import nullcontext
+
+    if device == "cpu":
+        amp = nullcontext()
+    else:
+        # Half-precision matmuls on GPU; CPU stays in FP32
+        amp = torch.autocast(device_type=device, dtype=torch.bfloat16 if device == "cuda" else torch.float16)
+    with torch.inference_mode(), amp:
+        feats = model.encode_image(images.to(device, non_blocking=True))
+    feats = torch.nn.functional.normalize(feats.float(), dim=-1)
+    return feats.cpu().numpy()
 
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--version", help="Optional embedding version tag (e.g., v3)")
+    ap.add_argument("--batch-size", type=int, default=64, help="Images per encode_image call")
+    ap.add_argument("--device", choices=["cuda", "mps", "cpu"], help="Defaults to CUDA, then MPS, then CPU")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                    help="DataLoader worker processes for image decode/preprocess (0 = main process)")
+    ap.add_argument("--rebuild-cache", action="store_true",
+                    help="Discard the preprocessed-pixel cache (reclaims slots of changed images)")
     args = ap.parse_args()
 
     root = Path(__file__).resolve().parents[1]
@@ -74,81 +221,127 @@ def main():
     out_parquet = out_dir / f"clip_vitb32{suffix}.parquet"
     out_jsonl = out_dir / f"clip_vitb32{suffix}.jsonl"
 
-    rows = _load_records(index_path)
     aliases = _load_aliases(root)
-    # Deduplicate by id, keep last occurrence
+    # Deduplicate by id while streaming, keep last occurrence
     by_id = {}
-    for r in rows:
+    for r in _iter_records(index_path):
         try:
-            ident = f"{r.get('document')}#{int(r.get('page'))}"
-            by_id[ident] = r
-        except Exception:
+            by_id[f"{r.get('document')}#{int(r.get('page'))}"] = r
+        except (AttributeError, TypeError, ValueError):
             continue
-    if not rows:
+    if not by_id:
         print("No curated records found.")
         return
 
-    model, preprocess, _tokenizer, torch = _load_model()
+    model, preprocess, _tokenizer, torch, device = _load_model(args.device)
 
     ids: List[str] = []
     labels: List[str] = []
     bases: List[str] = []
     pnums: List[int] = []
-    vecs: List[list] = []
+    vecs: List[np.ndarray] = []
 
+    todo = []
     for ident, r in by_id.items():
         img_path = r.get("image_path")
         if not img_path:
             continue
-        p = Path(img_path)
-        if not p.exists():
+        try:
+            st = os.stat(img_path)
+        except OSError:
             continue
-        vec = _embed_image(p, model, preprocess, torch)
-        lbl = r.get("label", "")
-        can = aliases.get(lbl, lbl)
-        # if alias mapping changed, recompute base/page from canonical
-        base = can
-        pnum = 1
-        if "_P" in can:
-            try:
-                base, pnum = can.rsplit("_P", 1)
-                pnum = int(pnum)
-            except Exception:
-                base, pnum = can, 1
-        ids.append(ident)
-        labels.append(can)
-        bases.append(base)
-        pnums.append(int(pnum))
-        vecs.append(vec.tolist())
+        todo.append((ident, r, Path(img_path), [str(img_path), st.st_mtime_ns, st.st_size]))
+
+    from torch.utils.data import DataLoader
+
+    transform, crop, mean, std = _split_preprocess(preprocess)
+    cache = _PreprocCache(out_dir / "preproc_cache", (3, crop[0], crop[1]), rebuild=args.rebuild_cache)
+    misses = [k for k, (ident, _r, _p, sig) in enumerate(todo) if cache.slot(ident, sig) is None]
+    if misses:
+        workers = max(0, args.workers)
+        loader = DataLoader(
+            _ImageDataset([todo[k][2] for k in misses], transform),
+            batch_size=max(1, args.batch_size),
+            num_workers=workers,
+            collate_fn=_collate,
+            prefetch_factor=4 if workers else None,
+        )
+        # Workers decode and resize in parallel; the main process appends to the cache
+        cache.append(
+            (todo[misses[i]][0], todo[misses[i]][3], arr)
+            for idxs, arrs in loader
+            for i, arr in zip(idxs, arrs)
+        )
+    print(f"Preprocess cache: {len(todo) - len(misses)} reused, {len(misses)} decoded")
+
+    pixels = cache.open()
+    ready = []
+    for ident, r, _p, sig in todo:
+        slot = cache.slot(ident, sig)
+        if slot is not None:
+            ready.append((ident, r, slot))
+    mean_t = torch.tensor(mean, device=device).view(1, 3, 1, 1)
+    std_t = torch.tensor(std, device=device).view(1, 3, 1, 1)
+    batch_size = max(1, args.batch_size)
+    for start in range(0, len(ready) if pixels is not None else 0, batch_size):
+        chunk = ready[start:start + batch_size]
+        slots = np.fromiter((slot for _, _, slot in chunk), dtype=np.int64, count=len(chunk))
+        batch = torch.from_numpy(pixels[slots])
+        if device == "cuda":
+            batch = batch.pin_memory()
+        # uint8 -> float and mean/std normalization run on the device
+        images = batch.to(device, non_blocking=True).float().div_(255).sub_(mean_t).div_(std_t)
+        batch_vecs = _embed_images(images, model, torch, device)
+        for (ident, r, _slot), vec in zip(chunk, batch_vecs):
+            lbl = r.get("label", "")
+            can = aliases.get(lbl, lbl)
+            # if alias mapping changed, recompute base/page from canonical
+            base = can
+            pnum = 1
+            if "_P" in can:
+                try:
+                    base, pnum = can.rsplit("_P", 1)
+                    pnum = int(pnum)
+                except Exception:
+                    base, pnum = can, 1
+            ids.append(ident)
+            labels.append(can)
+            bases.append(base)
+            pnums.append(int(pnum))
+            vecs.append(vec)
 
     if not ids:
         print("No images embedded.")
         return
-    
+    # One contiguous [N, D] float32 block; no per-element Python floats
+    V = np.ascontiguousarray(np.stack(vecs, axis=0), dtype=np.float32)
+
     # Always write JSONL (portable, no pyarrow dependency)
-    with open(out_jsonl, "w", encoding="utf-8") as f:
+    with open(out_jsonl, "wb") as f:
         for i in range(len(ids)):
             rec = {
                 "id": ids[i],
                 "label": labels[i],
                 "base_label": bases[i],
                 "page_in_form": pnums[i],
-                "vector": vecs[i],
+                "vector": V[i],
             }
-            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            f.write(orjson.dumps(rec, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE))
     print(f"Wrote {out_jsonl} with {len(ids)} vectors")
 
-    # Optionally write Parquet if pandas+pyarrow available
+    # Optionally write Parquet if pyarrow is available; vectors go in as a
+    # fixed-size list column so readers can reshape them without a row loop
     try:
-        import pandas as pd  # type: ignore
-        df = pd.DataFrame({
+        import pyarrow as pa  # type: ignore
+        import pyarrow.parquet as pq  # type: ignore
+        tbl = pa.table({
             "id": ids,
             "label": labels,
             "base_label": bases,
             "page_in_form": pnums,
-            "vector": vecs,
+            "vector": pa.FixedSizeListArray.from_arrays(pa.array(V.reshape(-1)), V.shape[1]),
         })
-        df.to_parquet(out_parquet, index=False)
+        pq.write_table(tbl, out_parquet, compression="zstd")
         print(f"Also wrote {out_parquet}")
     except Exception:
         pass
@@ -2,13 +2,120 @@ from __future__ import annotations
 
 from pathlib import Path
 import argparse
-import json
+import math
 import numpy as np
+import orjson
+
+
+def _keep_last(ids):
+    """Row positions that survive a keep-last dedupe by id, in first-seen id order."""
+    last = {ident: i for i, ident in enumerate(ids)}
+    return list(last), np.fromiter(last.values(), dtype=np.int64, count=len(last))
+
+
+def _load_parquet(path: Path):
+    import pyarrow.parquet as pq  # type: ignore
+
+    tbl = pq.read_table(path)
+    ids, sel = _keep_last(tbl.column("id").to_pylist())
+    col = tbl.column("vector").combine_chunks()
+    n = len(col)
+    if hasattr(col.type, "list_size"):
+        # FixedSizeList written by build_embeddings: reshape the flat buffer, no row loop
+        vecs = col.flatten().to_numpy().reshape(n, col.type.list_size)
+    else:
+        # Older files (pandas-written) store list<double> per row; every row has the
+        # same length, so the child values still reshape in one go
+        import pyarrow.compute as pc  # type: ignore
+
+        lengths = pc.list_value_length(col).to_numpy(zero_copy_only=False)
+        d = int(lengths[0]) if n else 0
+        if n and (lengths == d).all():
+            vecs = col.flatten().to_numpy(zero_copy_only=False).reshape(n, d)
+        else:
+            vecs = np.stack(col.to_numpy(zero_copy_only=False))
+    names = tbl.column_names
+    labels = tbl.column("label").to_pylist()
+    bases = tbl.column("base_label").to_pylist() if "base_label" in names else [""] * len(labels)
+    pnums = tbl.column("page_in_form").to_pylist() if "page_in_form" in names else [1] * len(labels)
+    sel_l = sel.tolist()
+    return (
+        ids,
+        [labels[i] for i in sel_l],
+        [bases[i] or "" for i in sel_l],
+        [int(pnums[i] or 1) for i in sel_l],
+        np.ascontiguousarray(vecs[sel], dtype="float32"),
+    )
+
+
+def _load_jsonl(path: Path):
+    by_id = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                rec = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue
+            by_id[rec.get("id")] = rec
+    recs = list(by_id.values())
+    vecs = np.asarray([r.get("vector", []) for r in recs], dtype="float32")
+    return (
+        list(by_id),
+        [r.get("label", "") for r in recs],
+        [r.get("base_label", "") for r in recs],
+        [int(r.get("page_in_form", 1)) for r in recs],
+        vecs,
+    )
+
+
+def _build_index(faiss, vecs: np.ndarray, index_type: str):
+    """Build the requested index over L2-normalized vectors; returns (index, meta)."""
+    n, d = vecs.shape
+    ip = faiss.METRIC_INNER_PRODUCT
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, 32, ip)
+        index.hnsw.efConstruction = 200
+        index.add(vecs)
+        return index, {"type": "hnsw", "efSearch": 64}
+    if index_type == "sq8":
+        # One int8 code per dimension: 4x smaller than flat, no coarse quantizer to train
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, ip)
+        index.train(vecs)
+        index.add(vecs)
+        return index, {"type": "sq8"}
+    if index_type == "ivfpq":
+        nlist = max(4, int(4 * math.sqrt(n)))
+        m = 64 if d % 64 == 0 else 1
+        # PQ with 8-bit codes needs 256 training points per sub-quantizer,
+        # IVF roughly 39 per list; small sets stay on the exact index
+        if n >= max(256, 39 * nlist):
+            quant = faiss.IndexFlatIP(d)
+            index = faiss.IndexIVFPQ(quant, d, nlist, m, 8, ip)
+            # k-means only needs a sample; past ~10x the minimum, training on every
+            # vector just costs time
+            n_train = min(n, max(256, 39 * nlist, n // 10))
+            if n_train < n:
+                sample = np.random.default_rng(0).choice(n, size=n_train, replace=False)
+                index.train(np.ascontiguousarray(vecs[np.sort(sample)]))
+            else:
+                index.train(vecs)
+            index.add(vecs)
+            return index, {"type": "ivfpq", "nprobe": min(nlist, 16)}
+        print(f"Only {n} vectors; too few to train IVF-PQ, building a flat index instead")
+    index = faiss.IndexFlatIP(d)
+    index.add(vecs)
+    return index, {"type": "flat"}
 
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--version", help="Embedding version tag to index (e.g., v3)")
+    ap.add_argument("--index-type", "--index", dest="index_type", choices=["flat", "hnsw", "sq8", "ivfpq"],
+                    default="flat",
+                    help="flat = exact search; hnsw = graph search; sq8 = exact scan over int8 codes; "
+                         "ivfpq = compressed codes for large sets")
     args = ap.parse_args()
 
     root = Path(__file__).resolve().parents[1]
@@ -20,74 +127,59 @@ def main():
     out_dir.mkdir(parents=True, exist_ok=True)
     out_index = out_dir / f"clip_vitb32{suffix}.index"
     out_idmap = out_dir / f"id_map{suffix}.jsonl"
+    out_idmap_npz = out_dir / f"id_map{suffix}.npz"
+    out_meta = out_dir / f"clip_vitb32{suffix}.meta.json"
 
     try:
         import faiss
     except Exception as e:
         raise SystemExit("faiss-cpu not installed. Add to requirements and install.") from e
 
-    # Deduplicate by id, keep last occurrence
-    by_id = {}
-
+    loaded = None
     if emb_parquet.exists():
         try:
-            import pandas as pd  # type: ignore
-            df = pd.read_parquet(emb_parquet)
-            for _, row in df.iterrows():
-            by_id[row["id"]] = {
-                "label": row["label"],
-                "base_label": row.get("base_label", ""),
-                "page_in_form": int(row.get("page_in_form", 1)),
-                "vector": np.array(row["vector"], dtype="float32"),
-            }
+            loaded = _load_parquet(emb_parquet)
         except Exception:
             # Fall back to JSONL if parquet cannot be read due to missing deps
-            pass
-    elif emb_jsonl.exists():
-        with open(emb_jsonl, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    rec = json.loads(line)
-                except Exception:
-                    continue
-                by_id[rec.get("id")] = {
-                    "label": rec.get("label", ""),
-                    "base_label": rec.get("base_label", ""),
-                    "page_in_form": int(rec.get("page_in_form", 1)),
-                    "vector": np.array(rec.get("vector", []), dtype="float32"),
-                }
-    else:
+            loaded = None
+    if loaded is None and emb_jsonl.exists():
+        loaded = _load_jsonl(emb_jsonl)
+    if loaded is None:
         raise SystemExit(f"No embeddings found in {emb_dir}")
 
-    if not by_id:
+    ids, labels, bases, pnums, vecs = loaded
+    if not ids:
         raise SystemExit("No embeddings to index.")
-
-    ids = list(by_id.keys())
-    labels = [by_id[i]["label"] for i in ids]
-    bases = [by_id[i]["base_label"] for i in ids]
-    pnums = [by_id[i]["page_in_form"] for i in ids]
-    vecs = np.stack([by_id[i]["vector"] for i in ids])
+    # normalize_L2 works in place and needs C-contiguous float32 (no-op when the loaders already produced it)
+    vecs = np.ascontiguousarray(vecs, dtype="float32")
     faiss.normalize_L2(vecs)
 
-    d = vecs.shape[1]
-    index = faiss.IndexFlatIP(d)
-    index.add(vecs)
+    index, meta = _build_index(faiss, vecs, args.index_type)
     faiss.write_index(index, str(out_index))
+    # Search-time parameters for the chosen index type, applied by suggest.py
+    out_meta.write_bytes(orjson.dumps(meta, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
+
+    # Columns are already plain Python lists; zip them straight into orjson lines
+    with open(out_idmap, "wb") as f:
+        for i, (ident, lbl, base, pnum) in enumerate(zip(ids, labels, bases, pnums)):
+            f.write(orjson.dumps({
+                "offset": i,
+                "id": ident,
+                "label": lbl,
+                "base_label": base,
+                "page_in_form": int(pnum),
+            }, option=orjson.OPT_APPEND_NEWLINE))
+    # Columnar copy of the same map; suggest.py loads it without any JSON parsing
+    with open(out_idmap_npz, "wb") as f:
+        np.savez(
+            f,
+            id=np.asarray(ids, dtype=str),
+            label=np.asarray(labels, dtype=str),
+            base_label=np.asarray(bases, dtype=str),
+            page_in_form=np.asarray(pnums, dtype=np.int32),
+        )
 
-    with open(out_idmap, "w", encoding="utf-8") as f:
-        for i in range(len(ids)):
-            f.write(json.dumps({
-                "offset": int(i),
-                "id": ids[i],
-                "label": labels[i],
-                "base_label": bases[i],
-                "page_in_form": int(pnums[i]),
-            }, ensure_ascii=False) + "\n")
-
-    print(f"Wrote {out_index} and {out_idmap}")
+    print(f"Wrote {out_index}, {out_idmap} and {out_idmap_npz}")
 
 
 if __name__ == "__main__":
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Sequence, Tuple
+
+import numpy as np
 
 
 def _try_import_fitz():
@@ -28,6 +32,55 @@ def _try_import_pdfplumber():
         return None
 
 
+# image_format -> (file extension, PIL format name)
+_IMAGE_FORMATS = {"png": ("png", "PNG"), "jpg": ("jpg", "JPEG"), "webp": ("webp", "WEBP")}
+# Quality for the lossy formats
+_IMAGE_QUALITY = 85
+
+
+def _scale_boxes(raw, factor: float, width_px: int, height_px: int):
+    """Map [N, 4] point boxes to pixel and 0..1000 boxes in one pass.
+
+    Rounds and clamps to the image, drops empty boxes, then normalizes. Returns
+    (keep mask over the input rows, pixel boxes, normalized boxes) as lists.
+    """
+    dims = np.array([width_px, height_px, width_px, height_px], dtype=np.float64)
+    px = np.rint(np.asarray(raw, dtype=np.float64).reshape(-1, 4) * factor).clip(0, dims)
+    keep = (px[:, 2] > px[:, 0]) & (px[:, 3] > px[:, 1])
+    px = px[keep]
+    norm = np.rint(px * 1000.0 / dims)
+    return keep, px.astype(np.int64).tolist(), norm.astype(np.int64).tolist()
+
+
+def _plumber_words(p, factor: float, width_px: int, height_px: int):
+    """Words and scaled boxes from a pdfplumber page."""
+    texts: List[str] = []
+    raw: List[Tuple[float, float, float, float]] = []
+    for w in p.extract_words(use_text_flow=True) or []:
+        txt = w.get("text", "")
+        if not txt or txt.isspace():
+            continue
+        texts.append(str(txt))
+        raw.append((float(w.get("x0", 0)), float(w.get("top", 0)), float(w.get("x1", 0)), float(w.get("bottom", 0))))
+    keep, boxes, boxes_norm = _scale_boxes(raw, factor, width_px, height_px)
+    return [t for t, k in zip(texts, keep.tolist()) if k], boxes, boxes_norm
+
+
+def open_pdf(pdf_path: Path):
+    """Open pdf_path with PyMuPDF for reuse across extract_page_features calls.
+
+    Returns None when fitz is unavailable or the file cannot be opened; callers
+    own the returned document and must close it.
+    """
+    fitz = _try_import_fitz()
+    if fitz is None:
+        return None
+    try:
+        return fitz.open(str(pdf_path))
+    except Exception:
+        return None
+
+
 def extract_page_features(
     pdf_path: Path,
     page: int,
@@ -35,30 +88,61 @@ def extract_page_features(
     base_label: str,
     document_name: str,
     dpi: int = 300,
+    pdf_doc=None,
+    image_format: str = "png",
+    render_image: bool = True,
+    pdfium_doc=None,
+    plumber_pdf=None,
 ) -> Dict[str, Any]:
     """Extract image and word-level layout features.
 
     Prefers PyMuPDF (fitz) for both rendering and words+bboxes. Falls back to
     pypdfium2 (render) + pdfplumber (words) when fitz is unavailable. Finally,
     uses pdfplumber-only (no image) if needed.
+
+    Pass an already-open fitz document (see open_pdf) as pdf_doc to avoid
+    reopening the PDF for every page; it is left open for the caller. The
+    fallbacks take an open pypdfium2 document / pdfplumber PDF the same way
+    (pdfium_doc, plumber_pdf).
+
+    image_format is "png" (lossless), "jpg" or "webp"; the lossy formats encode
+    several times faster than PNG at 300 DPI and are much smaller on disk.
+
+    With render_image=False no image is rendered or written (rendering dominates
+    the cost); words and boxes are still scaled to the pixel size the image would
+    have had, and the result has no image_path.
     """
+    ext, pil_format = _IMAGE_FORMATS.get(image_format, _IMAGE_FORMATS["png"])
     fitz = _try_import_fitz()
     if fitz is not None:
+        doc = None
         try:
-            doc = fitz.open(str(pdf_path))
+            doc = pdf_doc if pdf_doc is not None else fitz.open(str(pdf_path))
             p = doc.load_page(page - 1)
             zoom = dpi / 72.0
             mat = fitz.Matrix(zoom, zoom)
-            pix = p.get_pixmap(matrix=mat, alpha=False)
+            image_path = None
+            if render_image:
+                pix = p.get_pixmap(matrix=mat, alpha=False)
 
-            # Save image under images_root/base_label/<doc>_<page>.png
-            dest_dir = images_root / base_label
-            dest_dir.mkdir(parents=True, exist_ok=True)
-            image_name = f"{document_name.replace('/', '_')}_{page}.png"
-            image_path = dest_dir / image_name
-            pix.save(str(image_path))
+                # Save image under images_root/base_label/<doc>_<page>.<ext>
+                dest_dir = images_root / base_label
+                dest_dir.mkdir(parents=True, exist_ok=True)
+                image_name = f"{document_name.replace('/', '_')}_{page}.{ext}"
+                image_path = dest_dir / image_name
+                if ext == "png":
+                    pix.save(str(image_path))
+                elif ext == "jpg":
+                    # MuPDF's own JPEG encoder, no PIL round trip
+                    image_path.write_bytes(pix.tobytes("jpg", jpg_quality=_IMAGE_QUALITY))
+                else:
+                    pix.pil_save(str(image_path), format=pil_format, quality=_IMAGE_QUALITY)
 
-            width_px, height_px = pix.width, pix.height
+                width_px, height_px = pix.width, pix.height
+            else:
+                # Same pixel bounds get_pixmap would produce for this matrix
+                irect = (p.rect * mat).irect
+                width_px, height_px = irect.width, irect.height
 
             # Extract words in points
             try:
@@ -66,39 +150,31 @@ def extract_page_features(
             except Exception:
                 words_info = []
 
-            words: List[str] = []
-            boxes: List[List[int]] = []
-            boxes_norm: List[List[int]] = []
+            texts: List[str] = []
+            raw: List[Tuple[float, float, float, float]] = []
             for w in words_info:
                 if len(w) < 5:
                     continue
-                x0, y0, x1, y1, text = w[0], w[1], w[2], w[3], w[4]
+                text = w[4]
                 if not text or str(text).isspace():
                     continue
-                # points -> pixels using same zoom
-                x0p = max(0, int(round(x0 * zoom)))
-                y0p = max(0, int(round(y0 * zoom)))
-                x1p = min(width_px, int(round(x1 * zoom)))
-                y1p = min(height_px, int(round(y1 * zoom)))
-                if x1p <= x0p or y1p <= y0p:
-                    continue
-                words.append(str(text))
-                boxes.append([x0p, y0p, x1p, y1p])
-                # normalize to 0..1000
-                xn0 = int(round(x0p * 1000.0 / width_px))
-                yn0 = int(round(y0p * 1000.0 / height_px))
-                xn1 = int(round(x1p * 1000.0 / width_px))
-                yn1 = int(round(y1p * 1000.0 / height_px))
-                boxes_norm.append([xn0, yn0, xn1, yn1])
+                texts.append(str(text))
+                raw.append((w[0], w[1], w[2], w[3]))
+            # points -> pixels using same zoom, then normalize to 0..1000
+            keep, boxes, boxes_norm = _scale_boxes(raw, zoom, width_px, height_px)
+            words = [t for t, k in zip(texts, keep.tolist()) if k]
 
             page_size_pts = {"width": float(p.rect.width), "height": float(p.rect.height)}
             text_source = "pdf_text"
             text_len = sum(len(w) for w in words)
 
-            doc.close()
+            if pdf_doc is None:
+                doc.close()
 
-            return {
-                "image_path": str(image_path.as_posix()),
+            out: Dict[str, Any] = {}
+            if image_path is not None:
+                out["image_path"] = str(image_path.as_posix())
+            out.update({
                 "image_size": {"width_px": width_px, "height_px": height_px, "dpi": dpi},
                 "words": words,
                 "boxes": boxes,
@@ -106,28 +182,34 @@ def extract_page_features(
                 "page_size_pts": page_size_pts,
                 "text_source": text_source,
                 "text_len": text_len,
-            }
+            })
+            return out
         except Exception:
-            try:
-                doc.close()
-            except Exception:
-                pass
+            if pdf_doc is None and doc is not None:
+                try:
+                    doc.close()
+                except Exception:
+                    pass
 
     # Fallback: render with pypdfium2 and extract words with pdfplumber
-    pdfium = _try_import_pdfium()
+    # (without rendering, the pdfplumber-only path below gives the same result)
+    pdfium = _try_import_pdfium() if render_image else None
     pdfplumber = _try_import_pdfplumber()
     if pdfium is not None:
         try:
-            doc = pdfium.PdfDocument(str(pdf_path))
+            doc = pdfium_doc if pdfium_doc is not None else pdfium.PdfDocument(str(pdf_path))
             pg = doc[page - 1]
             scale = dpi / 72.0
             pil_image = pg.render(scale=scale).to_pil()
 
             dest_dir = images_root / base_label
             dest_dir.mkdir(parents=True, exist_ok=True)
-            image_name = f"{document_name.replace('/', '_')}_{page}.png"
+            image_name = f"{document_name.replace('/', '_')}_{page}.{ext}"
             image_path = dest_dir / image_name
-            pil_image.save(str(image_path))
+            if ext == "png":
+                pil_image.save(str(image_path))
+            else:
+                pil_image.save(str(image_path), format=pil_format, quality=_IMAGE_QUALITY)
             width_px, height_px = pil_image.size
 
             words: List[str] = []
@@ -135,32 +217,17 @@ def extract_page_features(
             boxes_norm: List[List[int]] = []
             page_size_pts = {"width": float(pg.get_size()[0]), "height": float(pg.get_size()[1])}
             text_source = "pdf_text"
-            if pdfplumber is not None:
+            if plumber_pdf is not None:
+                try:
+                    p = plumber_pdf.pages[page - 1]
+                    words, boxes, boxes_norm = _plumber_words(p, dpi / 72.0, width_px, height_px)
+                except Exception:
+                    pass
+            elif pdfplumber is not None:
                 try:
                     with pdfplumber.open(str(pdf_path)) as pdf:
                         p = pdf.pages[page - 1]
-                        factor = dpi / 72.0
-                        for w in p.extract_words(use_text_flow=True) or []:
-                            txt = w.get("text", "")
-                            if not txt or txt.isspace():
-                                continue
-                            x0 = int(round(float(w.get("x0", 0)) * factor))
-                            y0 = int(round(float(w.get("top", 0)) * factor))
-                            x1 = int(round(float(w.get("x1", 0)) * factor))
-                            y1 = int(round(float(w.get("bottom", 0)) * factor))
-                            x0 = max(0, min(x0, width_px))
-                            y0 = max(0, min(y0, height_px))
-                            x1 = max(0, min(x1, width_px))
-                            y1 = max(0, min(y1, height_px))
-                            if x1 <= x0 or y1 <= y0:
-                                continue
-                            words.append(str(txt))
-                            boxes.append([x0, y0, x1, y1])
-                            xn0 = int(round(x0 * 1000.0 / width_px))
-                            yn0 = int(round(y0 * 1000.0 / height_px))
-                            xn1 = int(round(x1 * 1000.0 / width_px))
-                            yn1 = int(round(y1 * 1000.0 / height_px))
-                            boxes_norm.append([xn0, yn0, xn1, yn1])
+                        words, boxes, boxes_norm = _plumber_words(p, dpi / 72.0, width_px, height_px)
                 except Exception:
                     pass
 
@@ -179,50 +246,100 @@ def extract_page_features(
             pass
 
     # Last-resort: pdfplumber only (no image). Still extract words + boxes scaled by DPI.
-    if pdfplumber is not None:
+    def _plumber_only(pdf) -> Dict[str, Any]:
+        p = pdf.pages[page - 1]
+        width_pts, height_pts = float(p.width), float(p.height)
+        width_px = int(round(width_pts * dpi / 72.0))
+        height_px = int(round(height_pts * dpi / 72.0))
+        words, boxes, boxes_norm = _plumber_words(p, dpi / 72.0, width_px, height_px)
+        text_len = sum(len(w) for w in words)
+        return {
+            "image_size": {"width_px": width_px, "height_px": height_px, "dpi": dpi},
+            "words": words,
+            "boxes": boxes,
+            "boxes_norm": boxes_norm,
+            "page_size_pts": {"width": width_pts, "height": height_pts},
+            "text_source": "pdf_text",
+            "text_len": text_len,
+        }
+
+    if plumber_pdf is not None:
+        try:
+            return _plumber_only(plumber_pdf)
+        except Exception:
+            pass
+    elif pdfplumber is not None:
         try:
             with pdfplumber.open(str(pdf_path)) as pdf:
-                p = pdf.pages[page - 1]
-                width_pts, height_pts = float(p.width), float(p.height)
-                width_px = int(round(width_pts * dpi / 72.0))
-                height_px = int(round(height_pts * dpi / 72.0))
-                words: List[str] = []
-                boxes: List[List[int]] = []
-                boxes_norm: List[List[int]] = []
-                factor = dpi / 72.0
-                for w in p.extract_words(use_text_flow=True) or []:
-                    txt = w.get("text", "")
-                    if not txt or txt.isspace():
-                        continue
-                    x0 = int(round(float(w.get("x0", 0)) * factor))
-                    y0 = int(round(float(w.get("top", 0)) * factor))
-                    x1 = int(round(float(w.get("x1", 0)) * factor))
-                    y1 = int(round(float(w.get("bottom", 0)) * factor))
-                    x0 = max(0, min(x0, width_px))
-                    y0 = max(0, min(y0, height_px))
-                    x1 = max(0, min(x1, width_px))
-                    y1 = max(0, min(y1, height_px))
-                    if x1 <= x0 or y1 <= y0:
-                        continue
-                    words.append(str(txt))
-                    boxes.append([x0, y0, x1, y1])
-                    xn0 = int(round(x0 * 1000.0 / width_px))
-                    yn0 = int(round(y0 * 1000.0 / height_px))
-                    xn1 = int(round(x1 * 1000.0 / width_px))
-                    yn1 = int(round(y1 * 1000.0 / height_px))
-                    boxes_norm.append([xn0, yn0, xn1, yn1])
-                text_len = sum(len(w) for w in words)
-                return {
-                    "image_size": {"width_px": width_px, "height_px": height_px, "dpi": dpi},
-                    "words": words,
-                    "boxes": boxes,
-                    "boxes_norm": boxes_norm,
-                    "page_size_pts": {"width": width_pts, "height": height_pts},
-                    "text_source": "pdf_text",
-                    "text_len": text_len,
-                }
+                return _plumber_only(pdf)
         except Exception:
             pass
 
     # Nothing available
     return {}
+
+
+def extract_pages_batch(
+    pdf_path: Path,
+    pages: Sequence[int],
+    images_root: Path,
+    base_labels: Sequence[str],
+    document_name: str,
+    dpi: int = 300,
+    image_format: str = "png",
+    render_image: bool = True,
+) -> List[Dict[str, Any]]:
+    """Run extract_page_features for several pages of one PDF, opening it once.
+
+    base_labels pairs up with pages (each page is filed under its own label).
+    Results keep the order of pages. Without fitz, the pypdfium2 / pdfplumber
+    fallbacks share one open document each instead of reparsing it per page.
+    """
+    doc = open_pdf(pdf_path)
+    pdfium_doc = plumber_pdf = None
+    try:
+        if doc is None:
+            pdfium = _try_import_pdfium() if render_image else None
+            pdfplumber = _try_import_pdfplumber()
+            try:
+                pdfium_doc = pdfium.PdfDocument(str(pdf_path)) if pdfium is not None else None
+            except Exception:
+                pdfium_doc = None
+            try:
+                plumber_pdf = pdfplumber.open(str(pdf_path)) if pdfplumber is not None else None
+            except Exception:
+                plumber_pdf = None
+        return [
+            extract_page_features(
+                pdf_path, page, images_root, base_label, document_name,
+                dpi=dpi, pdf_doc=doc, image_format=image_format, render_image=render_image,
+                pdfium_doc=pdfium_doc, plumber_pdf=plumber_pdf,
+            )
+            for page, base_label in zip(pages, base_labels)
+        ]
+    finally:
+        for d in (doc, pdfium_doc, plumber_pdf):
+            if d is not None:
+                d.close()
+
+
+def _extract_job(job: Tuple) -> List[Dict[str, Any]]:
+    return extract_pages_batch(*job)
+
+
+def extract_documents(
+    jobs: Sequence[Tuple[Path, Sequence[int], Path, Sequence[str], str]],
+    max_workers: int | None = None,
+) -> List[List[Dict[str, Any]]]:
+    """Extract many PDFs in parallel worker processes, one extract_pages_batch per job.
+
+    Each job is (pdf_path, pages, images_root, base_labels, document_name), optionally
+    followed by dpi, image_format and render_image. Only paths cross the process boundary; every
+    worker opens its own document.
+    Results keep the order of jobs.
+    """
+    workers = max_workers or min(os.cpu_count() or 1, 6)
+    if workers <= 1 or len(jobs) <= 1:
+        return [_extract_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(_extract_job, jobs))
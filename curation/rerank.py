@@ -3,31 +3,28 @@ from __future__ import annotations
 import re
 from typing import Dict, List, Optional
 
+import numpy as np
+
+_BASE_PAGE_RE = re.compile(r"^(.+)_P(\d+)$")
+_PAGE_TOK_RE = re.compile(r"\bP(\d+)\b")
+
 
 def _canonical(label: str, aliases: Dict[str, str]) -> str:
     return aliases.get(label, label)
 
 
 def _base_and_page(label: str) -> (str, Optional[int]):
-    m = re.match(r"^(.+)_P(\d+)$", label)
+    m = _BASE_PAGE_RE.match(label)
     if m:
-        try:
-            return m.group(1), int(m.group(2))
-        except Exception:
-            return m.group(1), None
+        return m.group(1), int(m.group(2))
     return label, None
 
 
 def _page_token_from_raw(raw_label: str) -> Optional[int]:
     if not raw_label:
         return None
-    m = re.search(r"\bP(\d+)\b", raw_label)
-    if m:
-        try:
-            return int(m.group(1))
-        except Exception:
-            return None
-    return None
+    m = _PAGE_TOK_RE.search(raw_label)
+    return int(m.group(1)) if m else None
 
 
 def rerank_suggestions(
@@ -44,22 +41,31 @@ def rerank_suggestions(
       - +0.02 if candidate page number (_P#) matches a token in raw_label/label
       - +0.02 if candidate base_label equals previous page's base_label (continuity)
     """
-    # Canonicalize + dedupe by canonical label (keep best raw score)
-    agg: Dict[str, Dict] = {}
-    for r in results or []:
+    # Canonicalize + dedupe by canonical label (keep best raw score). Codes follow
+    # first appearance, so one sort by (code, -score, position) leaves each label's
+    # best (earliest on ties) candidate first in its run, in first-seen label order.
+    results = list(results or [])
+    codes: Dict[str, int] = {}
+    cans: List[str] = []
+    raw_scores: List[float] = []
+    for r in results:
         can = _canonical(str(r.get("label", "")), aliases)
+        cans.append(can)
+        codes.setdefault(can, len(codes))
         try:
-            raw_score = float(r.get("score", 0.0))
+            raw_scores.append(float(r.get("score", 0.0)))
         except Exception:
-            raw_score = 0.0
-        kept = agg.get(can)
-        if kept is None or raw_score > float(kept.get("raw_score", 0.0)):
-            nr = dict(r)
-            nr["label"] = can
-            nr["raw_score"] = raw_score
-            agg[can] = nr
-
-    merged = list(agg.values())
+            raw_scores.append(0.0)
+    can_codes = np.fromiter((codes[c] for c in cans), dtype=np.int32, count=len(cans))
+    raw = np.asarray(raw_scores, dtype=np.float64)
+    order = np.lexsort((np.arange(len(raw)), -raw, can_codes))
+    _, first = np.unique(can_codes[order], return_index=True)
+    merged = []
+    for i in order[first].tolist():
+        nr = dict(results[i])
+        nr["label"] = cans[i]
+        nr["raw_score"] = raw_scores[i]
+        merged.append(nr)
 
     # Compute priors from page/prev context
     auto_can = None
@@ -82,29 +88,34 @@ def rerank_suggestions(
         prev_can = _canonical(str(prev_lbl), aliases)
         prev_base, _ = _base_and_page(prev_can)
 
-    # Apply small boosts
-    for m in merged:
-        score = float(m.get("raw_score", 0.0))
-        can = str(m.get("label", ""))
-        base, pnum = _base_and_page(can)
-        if auto_can and can == auto_can:
-            score += 0.03
-        # Only boost page-number match if the base label also matches the expected base
-        if (
-            page_num_hint is not None
-            and pnum is not None
-            and pnum == page_num_hint
-            and expected_base is not None
-            and base == expected_base
-        ):
-            score += 0.02
-        if prev_base and base == prev_base:
-            score += 0.02
-        m["score"] = score
-
-    # Sort and cut
-    merged.sort(key=lambda x: float(x.get("score", 0.0)), reverse=True)
-    merged = merged[: topk or 5]
-    for i, m in enumerate(merged, start=1):
-        m["rank"] = i
-    return merged
+    if not merged:
+        return []
+
+    # Apply small boosts as whole-array masks over parallel columns
+    n = len(merged)
+    cans = np.array([m["label"] for m in merged], dtype=object)
+    parsed = [_base_and_page(c) for c in cans]
+    bases = np.array([b for b, _ in parsed], dtype=object)
+    pnums = np.array([-1 if p is None else p for _, p in parsed], dtype=np.int64)
+    scores = np.fromiter((m["raw_score"] for m in merged), dtype=np.float64, count=n)
+    if auto_can:
+        scores += 0.03 * (cans == auto_can)
+    # Only boost page-number match if the base label also matches the expected base
+    if page_num_hint is not None and expected_base is not None:
+        scores += 0.02 * ((pnums == page_num_hint) & (bases == expected_base))
+    if prev_base:
+        scores += 0.02 * (bases == prev_base)
+
+    # Partial select everything scoring at least the k-th best, then order just those
+    # (ties keep candidate order, as the stable sort did)
+    k = min(topk or 5, n)
+    neg = -scores
+    top = np.flatnonzero(neg <= np.partition(neg, k - 1)[k - 1]) if k < n else np.arange(n)
+    top = top[np.lexsort((top, neg[top]))][:k]
+    out = []
+    for rank, i in enumerate(top.tolist(), start=1):
+        m = merged[i]
+        m["score"] = float(scores[i])
+        m["rank"] = rank
+        out.append(m)
+    return out
@@ -1,82 +1,203 @@
 from __future__ import annotations
 
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 from typing import List, Dict, Any
 import json
 import numpy as np
 
+# Tame OpenMP/threading conflicts; torch reads these when it is first imported
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("KMP_DUPLICATE_LIB_OK", "TRUE")
+os.environ.setdefault("KMP_INIT_AT_FORK", "FALSE")
 
-_MODEL = None
-_PREPROCESS = None
-_TORCH = None
-_INDEX = None
-_IDMAP = []
+try:
+    import faiss  # type: ignore
+except ImportError:
+    faiss = None
+
+
+@dataclass(slots=True)
+class _State:
+    """Lazily loaded model and index, shared by every request in the process."""
+
+    model: Any = None
+    preprocess: Any = None
+    torch: Any = None
+    # (resolved index path, FAISS index, id map), published as one tuple so the
+    # lock-free fast path never pairs one build's path with another build's index
+    faiss: Any = None
+
+
+_S = _State()
+
+# Serialize the one-time loads so a request racing the warmup thread waits for it
+# instead of loading a second copy
+_MODEL_LOCK = threading.Lock()
+_INDEX_LOCK = threading.Lock()
+
+# Short-side pixel size query pages are rasterized at before CLIP preprocessing
+_QUERY_RENDER_PX = 448
 
 
 def _ensure_open_clip():
-    global _MODEL, _PREPROCESS, _TORCH
-    if _MODEL is not None:
-        return _MODEL, _PREPROCESS, _TORCH
-    try:
-        # Tame OpenMP/threading conflicts before heavy imports
-        os.environ.setdefault("OMP_NUM_THREADS", "1")
-        os.environ.setdefault("KMP_DUPLICATE_LIB_OK", "TRUE")
-        os.environ.setdefault("KMP_INIT_AT_FORK", "FALSE")
-        import open_clip
-        import torch
-    except Exception as e:
-        raise RuntimeError("open_clip_torch/torch not installed")
-    model, _, preprocess = open_clip.create_model_and_transforms(
-        "ViT-B-32", pretrained="laion2b_s34b_b79k"
-    )
-    model = model.eval().to("cpu")
-    _MODEL, _PREPROCESS, _TORCH = model, preprocess, torch
-    return _MODEL, _PREPROCESS, _TORCH
+    if _S.model is not None:
+        return _S.model, _S.preprocess, _S.torch
+    with _MODEL_LOCK:
+        if _S.model is not None:
+            return _S.model, _S.preprocess, _S.torch
+        try:
+            import open_clip
+            import torch
+        except Exception as e:
+            raise RuntimeError("open_clip_torch/torch not installed")
+        model, _, preprocess = open_clip.create_model_and_transforms(
+            "ViT-B-32", pretrained="laion2b_s34b_b79k"
+        )
+        model = model.eval().to("cpu")
+        torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+        # The query input shape is fixed (1x3x224x224), so trace the image tower once;
+        # keep the eager module if tracing is not supported
+        try:
+            with torch.no_grad():
+                model.encode_image = torch.jit.trace(model.visual, torch.randn(1, 3, 224, 224))
+        except Exception:
+            pass
+        # The fast path checks only _S.model, so it must be published last
+        _S.preprocess, _S.torch = preprocess, torch
+        _S.model = model
+        return model, preprocess, torch
 
 
-def _ensure_faiss(root: Path):
-    global _INDEX, _IDMAP
-    if _INDEX is not None and _IDMAP:
-        return _INDEX, _IDMAP
+class _IdMap:
+    """Columnar id map loaded from id_map.npz; rows are built only for search hits."""
+
+    def __init__(self, cols):
+        self.ids = cols["id"].tolist()
+        self.labels = cols["label"].tolist()
+        self.bases = cols["base_label"].tolist()
+        self.pnums = cols["page_in_form"].tolist()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        return {
+            "offset": i,
+            "id": self.ids[i],
+            "label": self.labels[i],
+            "base_label": self.bases[i],
+            "page_in_form": self.pnums[i],
+        }
+
+
+def _load_idmap(idmap_path: Path):
+    # Prefer the .npz sidecar written alongside the JSONL, unless it is older
+    npz_path = idmap_path.with_suffix(".npz")
     try:
-        import faiss
+        if npz_path.stat().st_mtime_ns >= idmap_path.stat().st_mtime_ns:
+            with np.load(npz_path, allow_pickle=False) as cols:
+                return _IdMap(cols)
     except Exception:
-        raise RuntimeError("faiss-cpu not installed")
-    faiss_dir = root / "dataset" / "v2" / "faiss"
-    active = None
-    active_file = faiss_dir / "ACTIVE_VERSION.txt"
-    if active_file.exists():
-        try:
-            active = active_file.read_text(encoding="utf-8").strip()
-            if active and not active.startswith("_"):
-                active = f"_{active}"
-        except Exception:
-            active = None
-    index_path = faiss_dir / f"clip_vitb32{active or ''}.index"
-    idmap_path = faiss_dir / f"id_map{active or ''}.jsonl"
-    if not index_path.exists() or not idmap_path.exists():
-        raise RuntimeError("FAISS index or id_map.jsonl not found; build Step 5 first")
-    _INDEX = faiss.read_index(str(index_path))
-    _IDMAP = []
+        pass
+    idmap = []
     with open(idmap_path, "r", encoding="utf-8") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
             try:
-                _IDMAP.append(json.loads(line))
+                idmap.append(json.loads(line))
             except Exception:
                 continue
-    return _INDEX, _IDMAP
+    return idmap
+
+
+def _read_index(index_path: Path):
+    # Map the index read-only so workers share the page cache instead of each
+    # holding a private copy; fall back to a plain read if the build can't mmap it
+    try:
+        return faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except Exception:
+        return faiss.read_index(str(index_path))
+
+
+def _resolve_index_paths(root: Path, version: str = "auto"):
+    """Index, id map and meta paths for a FAISS build under dataset/v2/faiss.
+
+    version "auto" follows ACTIVE_VERSION.txt (unversioned files when absent);
+    otherwise it names a build tag such as "v3".
+    """
+    faiss_dir = root / "dataset" / "v2" / "faiss"
+    active = None
+    if version != "auto":
+        active = version or None
+    else:
+        active_file = faiss_dir / "ACTIVE_VERSION.txt"
+        if active_file.exists():
+            try:
+                active = active_file.read_text(encoding="utf-8").strip()
+            except Exception:
+                active = None
+    if active and not active.startswith("_"):
+        active = f"_{active}"
+    suffix = active or ""
+    return (
+        faiss_dir / f"clip_vitb32{suffix}.index",
+        faiss_dir / f"id_map{suffix}.jsonl",
+        faiss_dir / f"clip_vitb32{suffix}.meta.json",
+    )
+
+
+def _ensure_faiss(root: Path, version: str = "auto"):
+    # Keyed on the resolved path: "auto" follows ACTIVE_VERSION.txt, and an explicit
+    # tag naming the loaded build reuses it
+    index_path, idmap_path, meta_path = _resolve_index_paths(root, version)
+    loaded = _S.faiss
+    if loaded is not None and loaded[0] == index_path:
+        return loaded[1], loaded[2]
+    with _INDEX_LOCK:
+        loaded = _S.faiss
+        if loaded is not None and loaded[0] == index_path:
+            return loaded[1], loaded[2]
+        if faiss is None:
+            raise RuntimeError("faiss-cpu not installed")
+        if not index_path.exists() or not idmap_path.exists():
+            raise RuntimeError("FAISS index or id_map.jsonl not found; build Step 5 first")
+        # The index and the id map are independent files; read_index runs in C++ without
+        # the GIL, so the id map load overlaps it instead of queueing behind it
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            fut_index = ex.submit(_read_index, index_path)
+            fut_idmap = ex.submit(_load_idmap, idmap_path)
+            index = fut_index.result()
+            idmap = fut_idmap.result()
+        # HNSW / IVF-PQ builds record their search parameters next to the index
+        if meta_path.exists():
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                params = faiss.ParameterSpace()
+                for name in ("efSearch", "nprobe"):
+                    if name in meta:
+                        params.set_index_parameter(index, name, int(meta[name]))
+            except Exception:
+                pass
+        # OMP_NUM_THREADS=1 is pinned for torch; let FAISS use every core for searches
+        faiss.omp_set_num_threads(os.cpu_count() or 1)
+        _S.faiss = (index_path, index, idmap)
+        return index, idmap
 
 
 def _embed_image(img, model, preprocess, torch):
-    with torch.no_grad():
-        image = preprocess(img).unsqueeze(0)
-        feats = model.encode_image(image)
-        feats = feats / feats.norm(dim=-1, keepdim=True)
-    return feats.squeeze(0).cpu().numpy()
+    # inference_mode skips autograd's version-counter bookkeeping entirely; the model
+    # lives on the CPU, so row 0 is handed to NumPy as a view without a copy
+    with torch.inference_mode():
+        feats = model.encode_image(preprocess(img).unsqueeze(0))
+        feats = torch.nn.functional.normalize(feats, dim=-1)
+    return feats[0].numpy()
 
 
 def embed_pdf_page(pdf_path: Path, page: int):
@@ -88,31 +209,57 @@ def embed_pdf_page(pdf_path: Path, page: int):
         pg = doc[page - 1]
     except Exception:
         raise
-    pil_image = pg.render().to_pil()
+    # CLIP's preprocess resizes the short side to 224 px; rasterize at twice that
+    # (enough headroom for a clean downsample) instead of the full 72 DPI page
+    w_pts, h_pts = pg.get_size()
+    pil_image = pg.render(scale=_QUERY_RENDER_PX / max(1.0, min(w_pts, h_pts))).to_pil()
+    # _embed_image already returns a unit-norm vector
     vec = _embed_image(pil_image, model, preprocess, torch)
-    # normalize for cosine similarity
-    norm = np.linalg.norm(vec)
-    if norm > 0:
-        vec = vec / norm
-    return vec.astype("float32")
+    return np.asarray(vec, dtype="float32")
 
 
-def search_neighbors(root: Path, query_vec: np.ndarray, topk: int = 5) -> List[Dict[str, Any]]:
-    index, idmap = _ensure_faiss(root)
-    import faiss
-    D, I = index.search(query_vec.reshape(1, -1), topk)
+def _rows(idmap, idxs: np.ndarray, scores: np.ndarray) -> List[Dict[str, Any]]:
+    # Drop FAISS padding (-1) and out-of-range ids in one mask, convert once
+    ranks = np.flatnonzero((idxs >= 0) & (idxs < len(idmap)))
     results: List[Dict[str, Any]] = []
-    for rank in range(I.shape[1]):
-        idx = int(I[0, rank])
-        if idx < 0 or idx >= len(idmap):
-            continue
+    for rank, idx, score in zip(ranks.tolist(), idxs[ranks].tolist(), scores[ranks].tolist()):
         m = idmap[idx]
         results.append({
             "rank": rank + 1,
-            "score": float(D[0, rank]),
+            "score": score,
             "id": m.get("id"),
             "label": m.get("label"),
             "base_label": m.get("base_label"),
             "page_in_form": m.get("page_in_form"),
         })
     return results
+
+
+def search_neighbors_batch(
+    root: Path, queries: np.ndarray, topk: int = 5, version: str = "auto"
+) -> List[List[Dict[str, Any]]]:
+    """Search several query vectors ([nq, d]) in one index.search call; one result list per query."""
+    index, idmap = _ensure_faiss(root, version)
+    Q = np.ascontiguousarray(np.asarray(queries, dtype="float32").reshape(-1, index.d))
+    D, I = index.search(Q, topk)
+    return [_rows(idmap, I[q], D[q]) for q in range(len(Q))]
+
+
+def search_neighbors(root: Path, query_vec: np.ndarray, topk: int = 5, version: str = "auto") -> List[Dict[str, Any]]:
+    return search_neighbors_batch(root, query_vec.reshape(1, -1), topk, version)[0]
+
+
+def warmup(root: Path) -> None:
+    """Load the CLIP model (including its trace) and the FAISS index; best effort."""
+    for load in (_ensure_open_clip, lambda: _ensure_faiss(root)):
+        try:
+            load()
+        except Exception:
+            pass
+
+
+def start_warmup(root: Path) -> threading.Thread:
+    """Run warmup in a daemon thread so the first suggestion request finds both loaded."""
+    t = threading.Thread(target=warmup, args=(root,), name="suggest-warmup", daemon=True)
+    t.start()
+    return t
@@ -14,11 +14,18 @@ Usage examples:
   python extract_labels_ultratax.py --overwrite          # allow overwriting existing outputs
 """
 
-import json
+import argparse
+import functools
+import os
 import re
 import sys
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+import orjson
 
 # Try to import PDF reader libs; if unavailable, hardcode local venv paths.
 def _try_import_pdfs() -> Tuple[object, object, object, object]:
@@ -35,13 +42,18 @@ def _try_import_pdfs() -> Tuple[object, object, object, object]:
     except ModuleNotFoundError:
         pass
 
-    # Augment sys.path with local venv site-packages
-    repo_root = Path(__file__).resolve().parent
-    candidates = []
-    candidates.extend(repo_root.glob("venv/lib/python*/site-packages"))  # POSIX/macOS
-    candidates.extend(repo_root.glob("venv/Lib/site-packages"))  # Windows
-    for p in candidates:
-        sp = str(p)
+    # Augment sys.path with local venv site-packages. The result is exported so
+    # worker processes (which re-import this module under spawn) skip the globbing.
+    cached = os.environ.get("ULTRATAX_SITE_PACKAGES")
+    if cached is not None:
+        candidates = [sp for sp in cached.split(os.pathsep) if sp]
+    else:
+        repo_root = Path(__file__).resolve().parent
+        candidates = []
+        candidates.extend(str(p) for p in repo_root.glob("venv/lib/python*/site-packages"))  # POSIX/macOS
+        candidates.extend(str(p) for p in repo_root.glob("venv/Lib/site-packages"))  # Windows
+        os.environ["ULTRATAX_SITE_PACKAGES"] = os.pathsep.join(candidates)
+    for sp in candidates:
         if sp not in sys.path:
             sys.path.insert(0, sp)
 
@@ -64,17 +76,43 @@ def _try_import_pdfs() -> Tuple[object, object, object, object]:
 
 PdfReader, DictionaryObject, IndirectObject, ArrayObject = _try_import_pdfs()
 
+# Title normalization
+_PAGE_TITLE_RE = re.compile(r"^\s*(?:p(?:age)?|pg|p\.)\s*([ivxlcdm]+|\d+)\s*$")
+# Any run of whitespace, dashes or underscores collapses to one underscore
+_SEP_RE = re.compile(r"[\s\-_]+")
+# En/em dash -> "-" in one C-level pass; the basic sanitizer also folds commas to spaces
+_DASH_TRANS = str.maketrans({"–": "-", "—": "-"})
+_BASIC_TRANS = str.maketrans({"–": "-", "—": "-", ",": " "})
+# Page-prefix post-processing
+_PAGE_SUFFIX_RE = re.compile(r"^P\d+$")
+_PREFIXED_PAGE_RE = re.compile(r"^([A-Za-z0-9_()]+)_P(\d+)$")
+_BASE_PAGE_RE = re.compile(r"^(.+)_P(\d+)$")
+
 
 def _resolve(obj):
     return obj.get_object() if isinstance(obj, IndirectObject) else obj
 
 
+def _cached_resolver():
+    """A _resolve that memoizes indirect objects by (idnum, generation) for one document."""
+    cache: Dict[Tuple[int, int], object] = {}
+
+    def resolve(obj):
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            v = cache.get(key)
+            if v is None:
+                v = cache[key] = obj.get_object()
+            return v
+        return obj
+
+    return resolve
+
+
 def _normalize_title_basic(title: str) -> str:
     # Treat commas as separators; remove them before collapsing to underscores
-    title = title.replace(",", " ")
-    norm = re.sub(r"[\s\-]+", "_", title.strip())
-    norm = re.sub(r"_+", "_", norm).strip("_")
-    return norm
+    title = title.translate(_BASIC_TRANS)
+    return _SEP_RE.sub("_", title.strip()).strip("_")
 
 
 def _roman_to_int(s: str) -> int:
@@ -91,18 +129,23 @@ def _roman_to_int(s: str) -> int:
     return total
 
 
+# Titles repeat heavily ("Page 2", form names on every page of a form, the same
+# forms across the PDFs a worker processes); the result depends only on the title
+@functools.lru_cache(maxsize=4096)
 def _normalize_title(title: str) -> str:
     """Normalize bookmark titles using only the raw text.
 
     - Convert Page/Pg/P. N (or roman numerals) to P{N}.
     - Otherwise, sanitize the raw string: replace commas with spaces, collapse whitespace/dashes to underscores.
     - No heuristic mapping beyond what is explicitly present in the raw title.
-    """
-    raw = title.strip().replace("–", "-").replace("—", "-")
-    low = raw.lower()
 
-    # Page/Pg/P. + number or roman numeral -> P{n}
-    m = re.match(r"^\s*(?:p(?:age)?|pg|p\.)\s*([ivxlcdm]+|\d+)\s*$", low)
+    The title is NFKC-normalized first, so ligatures (U+FB01 "ﬁ"), fullwidth forms and
+    compatibility digits/spaces from PDF text match the ASCII patterns.
+    """
+    raw = unicodedata.normalize("NFKC", title).strip().translate(_DASH_TRANS)
+    # Page/Pg/P. + number or roman numeral -> P{n}. Every page token starts with
+    # "p" (raw is already stripped), so other titles skip the lower() and the match.
+    m = _PAGE_TITLE_RE.match(raw.lower()) if raw[:1] in ("p", "P") else None
     if m:
         tok = m.group(1)
         if tok.isdigit():
@@ -116,10 +159,10 @@ def _normalize_title(title: str) -> str:
     return _normalize_title_basic(raw)
 
 
-def _page_number_from_dest(dest, page_ref_map: Dict[Tuple[int, int], int]):
+def _page_number_from_dest(dest, page_ref_map: Dict[Tuple[int, int], int], resolve=_resolve):
     """Return 1-based page number from a /Dest array's first element, if resolvable."""
     try:
-        dest = _resolve(dest)
+        dest = resolve(dest)
         if isinstance(dest, ArrayObject) and dest:
             first = dest[0]
             if isinstance(first, IndirectObject):
@@ -131,7 +174,58 @@ def _page_number_from_dest(dest, page_ref_map: Dict[Tuple[int, int], int]):
     return None
 
 
-def _build_page_ref_map(reader: PdfReader) -> Dict[Tuple[int, int], int]:
+def _walk_page_tree(reader: PdfReader) -> Optional[Tuple[Dict[Tuple[int, int], int], int]]:
+    """(page ref -> 0-based index, page count) read from the /Pages tree's /Kids arrays.
+
+    Classifies nodes the way PdfReader flattens them (/Type, else /Pages when the
+    node has /Kids) without building PageObjects; returns None if the pages found
+    don't add up to the root /Count.
+    """
+    page_ref_map: Dict[Tuple[int, int], int] = {}
+    root = _resolve(reader.trailer["/Root"])
+    pages_root = root["/Pages"]
+    visited = set()
+    count = 0
+    stack = [iter((pages_root,))]
+    while stack:
+        kid = next(stack[-1], None)
+        if kid is None:
+            stack.pop()
+            continue
+        key = None
+        if isinstance(kid, IndirectObject):
+            key = (kid.idnum, kid.generation)
+            if key in visited:
+                continue
+            visited.add(key)
+        node = _resolve(kid)
+        if not isinstance(node, DictionaryObject):
+            continue
+        kind = node.get("/Type", "/Pages" if "/Kids" in node else "/Page")
+        if kind == "/Pages":
+            stack.append(iter(_resolve(node.get("/Kids")) or ()))
+        elif kind == "/Page":
+            if key is not None:
+                page_ref_map[key] = count
+            count += 1
+    if count != _resolve(_resolve(pages_root).get("/Count")):
+        return None
+    return page_ref_map, count
+
+
+def _page_refs(reader: PdfReader) -> Tuple[Dict[Tuple[int, int], int], int]:
+    """(page ref -> 0-based index, total pages) for resolving outline destinations.
+
+    reader.pages (pypdf flattens it even for len()) wraps every page in a PageObject
+    and copies inherited attributes onto it; the /Kids walk only reads the tree and
+    reader.pages remains the fallback for trees it can't account for.
+    """
+    try:
+        walked = _walk_page_tree(reader)
+        if walked is not None:
+            return walked
+    except Exception:
+        pass
     page_ref_map: Dict[Tuple[int, int], int] = {}
     try:
         for idx, page in enumerate(reader.pages):
@@ -140,60 +234,91 @@ def _build_page_ref_map(reader: PdfReader) -> Dict[Tuple[int, int], int]:
                 page_ref_map[(ref.idnum, ref.generation)] = idx
     except Exception:
         pass
-    return page_ref_map
+    return page_ref_map, len(reader.pages)
+
+
+# Entry for a page without a bookmark
+_DEFAULT_PAGE = {
+    "page": 0,
+    "family": "Other",
+    "label": "Other",          # current label (editable)
+    "auto_label": "Other",      # auto-generated label (for restore)
+    "updated_label": False,      # set True when user edits label
+    "multipage": False,
+    "raw_label": "Other",
+}
+
 
+def _is_base_section(lbl: str) -> bool:
+    # Treat any non-page, non-Other label as a base section
+    return lbl != "Other" and not _PAGE_SUFFIX_RE.match(lbl)
 
-def _collect_outline_entries(first_node, page_ref_map, normalize: bool = True) -> List[Tuple[str, int, int]]:
-    """Traverse the outline linked-list and collect (label, page_no, depth).
 
-    If normalize is True, applies _normalize_title to the Title, otherwise keeps raw Title text.
+def _is_page_suffix(lbl: str) -> bool:
+    return bool(_PAGE_SUFFIX_RE.match(lbl))
+
+
+def _collect_outline_entries(first_node, page_ref_map, resolve=_resolve) -> List[Tuple[str, str, int, int]]:
+    """Traverse the outline linked-list and collect (raw_label, label, page_no, depth).
+
+    raw_label is the stripped Title text and label its _normalize_title form; either
+    may be empty (callers skip empty ones), but not both.
     """
-    entries: List[Tuple[str, int, int]] = []
-
-    def node_to_entries(node_dict: DictionaryObject, depth: int):
-        # Label
-        label = None
-        t = node_dict.get("/Title")
-        if t is not None:
-            try:
-                raw_title = str(t)
-                label = _normalize_title(raw_title) if normalize else raw_title.strip()
-            except Exception:
-                label = None
-
-        # Page
-        page_no = None
-        dest = node_dict.get("/Dest")
-        if dest is None:
-            action = node_dict.get("/A")
-            action = _resolve(action) if action is not None else None
-            if isinstance(action, DictionaryObject):
-                dest = action.get("/D")
-        if dest is not None:
-            page_no = _page_number_from_dest(dest, page_ref_map)
-
-        if label and page_no is not None:
-            entries.append((label, int(page_no), depth))
-
-        # Children
-        first_child = node_dict.get("/First")
-        if first_child is not None:
-            cur = _resolve(first_child)
-            while isinstance(cur, DictionaryObject):
-                node_to_entries(cur, depth + 1)
-                next_sib = cur.get("/Next")
-                if next_sib is None:
-                    break
-                cur = _resolve(next_sib)
-
-    # Iterate siblings starting from first_node
-    cur = _resolve(first_node)
-    while isinstance(cur, DictionaryObject):
-        node_to_entries(cur, depth=0)
-        next_sib = cur.get("/Next")
-        if next_sib is None:
-            break
-        cur = _resolve(next_sib)
+    entries: List[Tuple[str, str, int, int]] = []
+    # (idnum, generation) of every outline node entered; malformed files can link
+    # /Next or /First back into the chain, which would otherwise never terminate
+    visited = set()
+
+    def enter(ref):
+        if isinstance(ref, IndirectObject):
+            key = (ref.idnum, ref.generation)
+            if key in visited:
+                return None
+            visited.add(key)
+        return resolve(ref)
+
+    # Pre-order walk with an explicit stack of (next sibling, depth) to resume at once
+    # a subtree is done; deep outlines can't hit the recursion limit
+    stack = [(first_node, 0)]
+    while stack:
+        ref, depth = stack.pop()
+        node = enter(ref)
+        while isinstance(node, DictionaryObject):
+            # Raw and normalized label from one Title read
+            raw_label = label = None
+            t = node.get("/Title")
+            if t is not None:
+                try:
+                    raw_title = str(t)
+                    raw_label = raw_title.strip()
+                    label = _normalize_title(raw_title)
+                except Exception:
+                    raw_label = label = None
+
+            # Page
+            page_no = None
+            dest = node.get("/Dest")
+            if dest is None:
+                action = node.get("/A")
+                action = resolve(action) if action is not None else None
+                if isinstance(action, DictionaryObject):
+                    dest = action.get("/D")
+            if dest is not None:
+                page_no = _page_number_from_dest(dest, page_ref_map, resolve)
+
+            if (raw_label or label) and page_no is not None:
+                entries.append((raw_label or "", label or "", int(page_no), depth))
+
+            # Descend into children first; the next sibling waits on the stack
+            next_sib = node.get("/Next")
+            first_child = node.get("/First")
+            if first_child is not None:
+                if next_sib is not None:
+                    stack.append((next_sib, depth))
+                node = enter(first_child)
+                depth += 1
+            else:
+                node = enter(next_sib) if next_sib is not None else None
 
     return entries
 
@@ -205,120 +330,120 @@ def build_bookmark_gt(
     config_name: str,
     source: str,
     apply_prefix: bool = True,
+    date_tag: str | None = None,
 ) -> Path:
     reader = PdfReader(str(pdf_path))
-    total_pages = len(reader.pages)
-    root = _resolve(reader.trailer.get("/Root"))
+    page_ref_map, total_pages = _page_refs(reader)
+    # Interned so every page entry shares one family object (and identity checks work)
+    family = sys.intern(family)
+    # Outline nodes, actions and destinations often share objects; resolve each once
+    resolve = _cached_resolver()
+    root = resolve(reader.trailer.get("/Root"))
     outlines_indirect = root.get("/Outlines") if isinstance(root, DictionaryObject) else None
 
-    # Default: Other/Other for every page
-    pages = [
-        {
-            "page": i,
-            "family": "Other",
-            "label": "Other",          # current label (editable)
-            "auto_label": "Other",      # auto-generated label (for restore)
-            "updated_label": False,      # set True when user edits label
-            "multipage": False,
-            "raw_label": "Other",
-        }
-        for i in range(1, total_pages + 1)
-    ]
-
+    # Deepest bookmark label / raw title per page (index = page number), if any
+    best_label: List[str | None] = []
+    best_raw: List[str | None] = []
     raw_pages = None
     if outlines_indirect:
-        outlines = _resolve(outlines_indirect)
+        outlines = resolve(outlines_indirect)
         first = outlines.get("/First") if outlines else None
         if first:
-            page_ref_map = _build_page_ref_map(reader)
-            # normalized entries for main pages array
-            entries = _collect_outline_entries(first, page_ref_map, normalize=True)
-            # raw entries for bookmarks view
-            entries_raw = _collect_outline_entries(first, page_ref_map, normalize=False)
-            # Choose deepest label per page
-            best_for_page: Dict[int, Tuple[str, int]] = {}
-            for label, page_no, depth in entries:
-                cur = best_for_page.get(page_no)
-                if cur is None or depth >= cur[1]:
-                    best_for_page[page_no] = (label, depth)
-            # Choose deepest raw label per page
-            best_for_page_raw: Dict[int, Tuple[str, int]] = {}
-            for label, page_no, depth in entries_raw:
-                cur = best_for_page_raw.get(page_no)
-                if cur is None or depth >= cur[1]:
-                    best_for_page_raw[page_no] = (label, depth)
-            for pno, (label, _depth) in best_for_page.items():
-                if 1 <= pno <= total_pages:
-                    raw_lbl = best_for_page_raw.get(pno, ("Other", 0))[0]
-                    pages[pno - 1] = {
-                        "page": pno,
-                        "family": family,
-                        "label": label,
-                        "auto_label": label,
-                        "updated_label": False,
-                        "multipage": False,
-                        "raw_label": raw_lbl,
-                    }
+            # One walk yields normalized labels (main pages array) and raw titles
+            # (bookmarks view); choose the deepest of each per page
+            entries = _collect_outline_entries(first, page_ref_map, resolve)
+            # Flat per-page slots (index = page number); depth -1 means no bookmark yet
+            n_slots = total_pages + 1
+            best_label = [None] * n_slots
+            best_depth = [-1] * n_slots
+            best_raw = [None] * n_slots
+            best_raw_depth = [-1] * n_slots
+            for raw_label, label, page_no, depth in entries:
+                if not 1 <= page_no <= total_pages:
+                    continue
+                # The same section title usually tags many pages; intern the winners
+                # so those pages share one string instead of a copy per bookmark
+                if label and depth >= best_depth[page_no]:
+                    best_depth[page_no] = depth
+                    best_label[page_no] = sys.intern(label)
+                if raw_label and depth >= best_raw_depth[page_no]:
+                    best_raw_depth[page_no] = depth
+                    best_raw[page_no] = sys.intern(raw_label)
 
             # Build raw pages array parallel to pages (original bookmark titles)
             raw_pages = [
                 {"page": i, "family": "Other", "label": "Other"}
-                for i in range(1, total_pages + 1)
+                if best_raw[i] is None
+                else {"page": i, "family": family, "label": best_raw[i]}
+                for i in range(1, n_slots)
             ]
-            for pno, (label, _depth) in best_for_page_raw.items():
-                if 1 <= pno <= total_pages:
-                    raw_pages[pno - 1] = {"page": pno, "family": family, "label": label}
+
+    # Bookmarked pages get their label; the rest are Other/Other copies of one template
+    # (every entry stays its own dict, the post-processing below mutates them)
+    pages = [
+        {
+            "page": pno,
+            "family": family,
+            "label": best_label[pno],
+            "auto_label": best_label[pno],
+            "updated_label": False,
+            "multipage": False,
+            "raw_label": best_raw[pno] or "Other",
+        }
+        if best_label and best_label[pno] is not None
+        else {**_DEFAULT_PAGE, "page": pno}
+        for pno in range(1, total_pages + 1)
+    ]
 
     # Post-process: Only apply P1/P2 normalization when requested (UltraTax mode)
     if apply_prefix:
         # - When a base section is seen, that page becomes Base_P1.
         # - Subsequent P2/P3/... pages become Base_P2/Base_P3/... until interrupted.
         # - Already-prefixed labels keep their value and continue the prefix.
-        def is_base_section(lbl: str) -> bool:
-            # Treat any non-page, non-Other label as a base section
-            if lbl == "Other":
-                return False
-            if re.match(r"^P\d+$", lbl):
-                return False
-            return True
-
-        def is_page_suffix(lbl: str) -> bool:
-            return bool(re.match(r"^P\d+$", lbl))
-
-        def prefixed_page_match(lbl: str):
-            # Generic: Any base label followed by _P{n}
-            return re.match(r"^([A-Za-z0-9_()]+)_P(\d+)$", lbl)
-
+        # Pages are grouped by base as labels are assigned, so the multipage flags
+        # need no second regex pass. Entries outside the family are Other/Other
+        # defaults and belong to no group.
         current_prefix = None
+        base_groups: Dict[str, List[dict]] = {}
         for entry in pages:
-            lbl = entry.get("label", "")
-            fam = entry.get("family", "")
-            if fam != family:
+            # Every entry was built above with all keys present, and family is
+            # interned, so identity is equality here
+            if entry["family"] is not family:
                 continue
+            lbl = entry["label"]
 
-            m = prefixed_page_match(lbl)
+            m = _PREFIXED_PAGE_RE.match(lbl)
             if m:
                 current_prefix = m.group(1)
+                base_groups.setdefault(current_prefix, []).append(entry)
                 continue
 
-            if is_base_section(lbl):
+            if _is_base_section(lbl):
                 current_prefix = lbl
                 new_val = f"{current_prefix}_P1"
                 entry["label"] = new_val
                 entry["auto_label"] = new_val
+                base_groups.setdefault(current_prefix, []).append(entry)
                 continue
 
-            if is_page_suffix(lbl) and current_prefix:
+            if _is_page_suffix(lbl) and current_prefix:
                 new_val = f"{current_prefix}_{lbl}"
                 entry["label"] = new_val
                 entry["auto_label"] = new_val
+                base_groups[current_prefix].append(entry)
                 continue
 
             # interrupt on any other label
             current_prefix = None
 
-    # Compute multipage flags: mark True for any Base_Pn group with size >= 2
-    pages = _apply_multipage_flags(pages)
+        # Mark True for any Base_Pn group with size >= 2 (entries start out False)
+        for group in base_groups.values():
+            if len(group) >= 2:
+                for entry in group:
+                    entry["multipage"] = True
+    else:
+        # Compute multipage flags: mark True for any Base_Pn group with size >= 2
+        pages = _apply_multipage_flags(pages)
 
     data = {
         "document": pdf_path.name,
@@ -331,37 +456,71 @@ def build_bookmark_gt(
     }
 
     outdir.mkdir(parents=True, exist_ok=True)
-    from datetime import datetime
     base = pdf_path.stem
-    date_tag = datetime.now().strftime("%b%d")  # e.g., Oct09
+    if date_tag is None:
+        date_tag = datetime.now().strftime("%b%d")  # e.g., Oct09
     out_path = outdir / f"{base}_{date_tag}.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-        f.write("\n")
+    # One contiguous write to a sibling temp file, then an atomic swap, so the
+    # editor never reads a half-written mapping
+    tmp_path = out_path.with_suffix(out_path.suffix + ".tmp")
+    tmp_path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
+    os.replace(tmp_path, out_path)
     return out_path
 
 
 def _apply_multipage_flags(pages: List[dict]) -> List[dict]:
+    # Match each label once, remembering its base for the flag pass
+    bases: List[str | None] = []
     base_counts: Dict[str, int] = {}
-    # First pass: count pages per base
     for e in pages:
-        lbl = e.get("label", "")
-        m = re.match(r"^(.+)_P(\d+)$", lbl)
-        if m:
-            base = m.group(1)
+        m = _BASE_PAGE_RE.match(e.get("label", ""))
+        base = m.group(1) if m else None
+        bases.append(base)
+        if base is not None:
             base_counts[base] = base_counts.get(base, 0) + 1
-    # Second pass: set flags
-    for e in pages:
-        lbl = e.get("label", "")
-        m = re.match(r"^(.+)_P(\d+)$", lbl)
-        if m and base_counts.get(m.group(1), 0) >= 2:
-            e["multipage"] = True
-        else:
-            e["multipage"] = False
+    # Flag every page whose base spans two or more pages
+    for e, base in zip(pages, bases):
+        e["multipage"] = base is not None and base_counts[base] >= 2
     return pages
 
 
+def _list_pdfs(pdf_dir: Path) -> List[Path]:
+    """PDFs directly under pdf_dir, any extension case, from one directory scan."""
+    # A single scandir lists each file once, so .pdf/.PDF can't be double-counted on
+    # case-insensitive filesystems the way two globs were
+    with os.scandir(pdf_dir) as it:
+        return sorted(
+            (Path(e.path) for e in it if e.name.lower().endswith(".pdf") and e.is_file()),
+            key=lambda p: p.name.lower(),
+        )
+
+
+_OUTPUT_NAME_RE = re.compile(r"^(.+)_[A-Za-z]+\d\d\.json$")
+
+
+def _newest_outputs(outdir: Path) -> Dict[str, int]:
+    """Newest st_mtime_ns of the <stem>_<date tag>.json outputs per PDF stem."""
+    newest: Dict[str, int] = {}
+    if not outdir.is_dir():
+        return newest
+    with os.scandir(outdir) as it:
+        for e in it:
+            m = _OUTPUT_NAME_RE.match(e.name)
+            if m and e.is_file():
+                stem, mtime = m.group(1), e.stat().st_mtime_ns
+                if mtime > newest.get(stem, -1):
+                    newest[stem] = mtime
+    return newest
+
+
 def main():
+    ap = argparse.ArgumentParser(description="Generate UltraTax ground-truth JSON from PDF bookmarks")
+    ap.add_argument("--overwrite", action="store_true",
+                    help="Rebuild every PDF, even when an output newer than the PDF exists "
+                         "(also ULTRATAX_OVERWRITE=1)")
+    args = ap.parse_args()
+    overwrite = args.overwrite or os.environ.get("ULTRATAX_OVERWRITE") == "1"
+
     # Hardcoded, super-light defaults
     pdf_dir = Path("Source_PDF")
     outdir = Path("Ground_Truth")
@@ -372,18 +531,43 @@ def main():
     if not pdf_dir.exists() or not pdf_dir.is_dir():
         raise SystemExit(f"Not a directory: {pdf_dir}")
 
-    files: List[Path] = []
-    files.extend(sorted(pdf_dir.glob("*.PDF")))
-    files.extend(sorted(pdf_dir.glob("*.pdf")))
+    files = _list_pdfs(pdf_dir)
 
     if not files:
         print(f"No PDFs found in {pdf_dir}")
         return
 
+    # Up-to-date check: skip PDFs whose latest output (any date tag) is newer
+    if not overwrite:
+        newest = _newest_outputs(outdir)
+        todo = []
+        for pdf_path in files:
+            if newest.get(pdf_path.stem, -1) >= pdf_path.stat().st_mtime_ns:
+                print(f"Skip (up to date): {pdf_path}")
+            else:
+                todo.append(pdf_path)
+        files = todo
+        if not files:
+            return
+
     outdir.mkdir(parents=True, exist_ok=True)
-    for pdf_path in files:
-        out_path = build_bookmark_gt(pdf_path, outdir, family, config_name, source, apply_prefix=True)
-        print(f"Wrote {out_path}")
+    # One tag for the whole batch, even if it runs past midnight
+    date_tag = datetime.now().strftime("%b%d")
+    # PDFs are independent and parsing is CPU-bound pure Python, so fan out over
+    # processes (pypdf objects are not safe to share across threads)
+    workers = min(os.cpu_count() or 1, len(files))
+    if workers <= 1:
+        for pdf_path in files:
+            out_path = build_bookmark_gt(pdf_path, outdir, family, config_name, source, apply_prefix=True, date_tag=date_tag)
+            print(f"Wrote {out_path}")
+        return
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futs = {
+            ex.submit(build_bookmark_gt, pdf_path, outdir, family, config_name, source, apply_prefix=True, date_tag=date_tag): pdf_path
+            for pdf_path in files
+        }
+        for fut in as_completed(futs):
+            print(f"Wrote {fut.result()}")
 
 
 if __name__ == "__main__":
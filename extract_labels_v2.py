@@ -21,22 +21,41 @@ Notes:
 
 import argparse
 import json
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from PyPDF2 import PdfReader
 from PyPDF2.generic import DictionaryObject, IndirectObject, ArrayObject
 
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+
+def _try_import_fitz():
+    try:
+        import fitz  # PyMuPDF
+        return fitz
+    except Exception:
+        return None
+
 
 def _resolve(obj):
     return obj.get_object() if isinstance(obj, IndirectObject) else obj
 
 
+# Runs of whitespace, hyphens and underscores collapse to one underscore in a single pass
+_SEP_RE = re.compile(r"[\s\-_]+")
+# An explicit destination whose first element is a page reference, e.g. "[12 0 R /Fit]"
+_PAGE_REF_DEST_RE = re.compile(r"^\s*\[\s*\d+\s+\d+\s+R\b")
+
+
 def _normalize_title(title: str) -> str:
-    norm = re.sub(r"[\s\-]+", "_", title.strip())
-    norm = re.sub(r"_+", "_", norm).strip("_")
-    return norm
+    return _SEP_RE.sub("_", title.strip()).strip("_")
 
 
 def _page_number_from_dest(dest, page_ref_map: Dict[Tuple[int, int], int]):
@@ -54,7 +73,58 @@ def _page_number_from_dest(dest, page_ref_map: Dict[Tuple[int, int], int]):
     return None
 
 
-def _build_page_ref_map(reader: PdfReader) -> Dict[Tuple[int, int], int]:
+def _walk_page_tree(reader: PdfReader) -> Optional[Tuple[Dict[Tuple[int, int], int], int]]:
+    """(page ref -> 0-based index, page count) read from the /Pages tree's /Kids arrays.
+
+    Classifies nodes the way PdfReader flattens them (/Type, else /Pages when the
+    node has /Kids) without building PageObjects; returns None if the pages found
+    don't add up to the root /Count.
+    """
+    page_ref_map: Dict[Tuple[int, int], int] = {}
+    root = _resolve(reader.trailer["/Root"])
+    pages_root = root["/Pages"]
+    visited = set()
+    count = 0
+    stack = [iter((pages_root,))]
+    while stack:
+        kid = next(stack[-1], None)
+        if kid is None:
+            stack.pop()
+            continue
+        key = None
+        if isinstance(kid, IndirectObject):
+            key = (kid.idnum, kid.generation)
+            if key in visited:
+                continue
+            visited.add(key)
+        node = _resolve(kid)
+        if not isinstance(node, DictionaryObject):
+            continue
+        kind = node.get("/Type", "/Pages" if "/Kids" in node else "/Page")
+        if kind == "/Pages":
+            stack.append(iter(_resolve(node.get("/Kids")) or ()))
+        elif kind == "/Page":
+            if key is not None:
+                page_ref_map[key] = count
+            count += 1
+    if count != _resolve(_resolve(pages_root).get("/Count")):
+        return None
+    return page_ref_map, count
+
+
+def _page_refs(reader: PdfReader) -> Tuple[Dict[Tuple[int, int], int], int]:
+    """(page ref -> 0-based index, total pages) for resolving outline destinations.
+
+    reader.pages (pypdf flattens it even for len()) wraps every page in a PageObject
+    and copies inherited attributes onto it; the /Kids walk only reads the tree and
+    reader.pages remains the fallback for trees it can't account for.
+    """
+    try:
+        walked = _walk_page_tree(reader)
+        if walked is not None:
+            return walked
+    except Exception:
+        pass
     page_ref_map: Dict[Tuple[int, int], int] = {}
     try:
         for idx, page in enumerate(reader.pages):
@@ -63,84 +133,142 @@ def _build_page_ref_map(reader: PdfReader) -> Dict[Tuple[int, int], int]:
                 page_ref_map[(ref.idnum, ref.generation)] = idx
     except Exception:
         pass
-    return page_ref_map
+    return page_ref_map, len(reader.pages)
 
 
 def _collect_outline_entries(first_node, page_ref_map) -> List[Tuple[str, int, int]]:
     """Traverse the outline linked-list and collect (label, page_no, depth)."""
     entries: List[Tuple[str, int, int]] = []
-
-    def node_to_entries(node_dict: DictionaryObject, depth: int):
-        # Label
-        label = None
-        t = node_dict.get("/Title")
-        if t is not None:
-            try:
-                label = _normalize_title(str(t))
-            except Exception:
-                label = None
-
-        # Page
-        page_no = None
-        dest = node_dict.get("/Dest")
-        if dest is None:
-            action = node_dict.get("/A")
-            action = _resolve(action) if action is not None else None
-            if isinstance(action, DictionaryObject):
-                dest = action.get("/D")
-        if dest is not None:
-            page_no = _page_number_from_dest(dest, page_ref_map)
-
-        if label and page_no is not None:
-            entries.append((label, int(page_no), depth))
-
-        # Children
-        first_child = node_dict.get("/First")
-        if first_child is not None:
-            cur = _resolve(first_child)
-            while isinstance(cur, DictionaryObject):
-                node_to_entries(cur, depth + 1)
-                next_sib = cur.get("/Next")
-                if next_sib is None:
-                    break
-                cur = _resolve(next_sib)
-
-    # Iterate siblings starting from first_node
-    cur = _resolve(first_node)
-    while isinstance(cur, DictionaryObject):
-        node_to_entries(cur, depth=0)
-        next_sib = cur.get("/Next")
-        if next_sib is None:
-            break
-        cur = _resolve(next_sib)
+    # (idnum, generation) of every outline node entered; malformed files can link
+    # /Next or /First back into the chain, which would otherwise never terminate
+    visited = set()
+
+    def enter(ref):
+        if isinstance(ref, IndirectObject):
+            key = (ref.idnum, ref.generation)
+            if key in visited:
+                return None
+            visited.add(key)
+        return _resolve(ref)
+
+    # Pre-order walk with an explicit stack of (next sibling, depth) to resume at once
+    # a subtree is done; deep outlines can't hit the recursion limit
+    stack = [(first_node, 0)]
+    while stack:
+        ref, depth = stack.pop()
+        node = enter(ref)
+        while isinstance(node, DictionaryObject):
+            # Label
+            label = None
+            t = node.get("/Title")
+            if t is not None:
+                try:
+                    label = _normalize_title(str(t))
+                except Exception:
+                    label = None
+
+            # Page
+            page_no = None
+            dest = node.get("/Dest")
+            if dest is None:
+                action = node.get("/A")
+                action = _resolve(action) if action is not None else None
+                if isinstance(action, DictionaryObject):
+                    dest = action.get("/D")
+            if dest is not None:
+                page_no = _page_number_from_dest(dest, page_ref_map)
+
+            if label and page_no is not None:
+                entries.append((label, int(page_no), depth))
+
+            # Descend into children first; the next sibling waits on the stack
+            next_sib = node.get("/Next")
+            first_child = node.get("/First")
+            if first_child is not None:
+                if next_sib is not None:
+                    stack.append((next_sib, depth))
+                node = enter(first_child)
+                depth += 1
+            else:
+                node = enter(next_sib) if next_sib is not None else None
 
     return entries
 
 
-def build_bookmark_gt(pdf_path: Path, outdir: Path, family: str, config_name: str) -> Path:
+def _has_page_ref_dest(doc, xref: int) -> bool:
+    """True if the outline item at xref targets an explicit [page-ref ...] destination.
+
+    This is the only form _page_number_from_dest resolves; named destinations (a
+    string or name, directly or as a GoTo action's /D) are left unresolved there.
+    """
+    kind, val = doc.xref_get_key(xref, "Dest")
+    if kind == "null":
+        kind, val = doc.xref_get_key(xref, "A/D")
+    if kind == "xref":
+        val = doc.xref_object(int(val.split()[0]), compressed=True)
+        kind = "array"
+    return kind == "array" and _PAGE_REF_DEST_RE.match(val) is not None
+
+
+def _outline_entries_mupdf(pdf_path: Path) -> Optional[Tuple[int, List[Tuple[str, int, int]]]]:
+    """(total_pages, [(label, page_no, depth)]) read with PyMuPDF, or None if unavailable.
+
+    get_toc walks the outline and resolves destinations in C, in the same pre-order
+    as _collect_outline_entries; depth is 0 for top-level entries. MuPDF also
+    resolves named destinations, which the PyPDF2 path does not; those entries are
+    dropped so both paths label the same pages.
+    """
+    fitz = _try_import_fitz()
+    if fitz is None:
+        return None
+    entries: List[Tuple[str, int, int]] = []
+    try:
+        with fitz.open(str(pdf_path)) as doc:
+            total_pages = doc.page_count
+            toc = doc.get_toc(simple=False)
+            # MuPDF gives up on malformed outlines (e.g. cyclic /Next links) and
+            # returns nothing; let the PyPDF2 walk, which tolerates them, decide
+            if not toc and doc.xref_get_key(doc.pdf_catalog(), "Outlines/First")[0] != "null":
+                return None
+            for level, title, page_no, dest in toc:
+                label = _normalize_title(title or "")
+                if label and page_no >= 1 and _has_page_ref_dest(doc, dest.get("xref", 0)):
+                    entries.append((label, int(page_no), level - 1))
+    except Exception:
+        return None
+    return total_pages, entries
+
+
+def _outline_entries_pypdf(pdf_path: Path) -> Tuple[int, List[Tuple[str, int, int]]]:
     reader = PdfReader(str(pdf_path))
-    total_pages = len(reader.pages)
+    page_ref_map, total_pages = _page_refs(reader)
     root = _resolve(reader.trailer.get("/Root"))
     outlines_indirect = root.get("/Outlines") if isinstance(root, DictionaryObject) else None
-
-    # Default: Other/Other for every page
-    pages = [{"page": i, "family": "Other", "label": "Other"} for i in range(1, total_pages + 1)]
-
     if outlines_indirect:
         outlines = _resolve(outlines_indirect)
         first = outlines.get("/First") if outlines else None
         if first:
-            page_ref_map = _build_page_ref_map(reader)
-            entries = _collect_outline_entries(first, page_ref_map)
-            # Choose deepest label per page
-            best_for_page: Dict[int, Tuple[str, int]] = {}
-            for label, page_no, depth in entries:
-                cur = best_for_page.get(page_no)
-                if cur is None or depth >= cur[1]:
-                    best_for_page[page_no] = (label, depth)
-            for pno, (label, _depth) in best_for_page.items():
-                if 1 <= pno <= total_pages:
-                    pages[pno - 1] = {"page": pno, "family": family, "label": label}
+            return total_pages, _collect_outline_entries(first, page_ref_map)
+    return total_pages, []
+
+
+def build_bookmark_gt(pdf_path: Path, outdir: Path, family: str, config_name: str) -> Path:
+    # PyMuPDF parses the outline in C; PyPDF2 is the pure-Python fallback
+    found = _outline_entries_mupdf(pdf_path)
+    total_pages, entries = found if found is not None else _outline_entries_pypdf(pdf_path)
+
+    # Default: Other/Other for every page
+    pages = [{"page": i, "family": "Other", "label": "Other"} for i in range(1, total_pages + 1)]
+
+    # Choose deepest label per page
+    best_for_page: Dict[int, Tuple[str, int]] = {}
+    for label, page_no, depth in entries:
+        cur = best_for_page.get(page_no)
+        if cur is None or depth >= cur[1]:
+            best_for_page[page_no] = (label, depth)
+    for pno, (label, _depth) in best_for_page.items():
+        if 1 <= pno <= total_pages:
+            pages[pno - 1] = {"page": pno, "family": family, "label": label}
 
     data = {
         "document": pdf_path.name,
@@ -152,7 +280,12 @@ def build_bookmark_gt(pdf_path: Path, outdir: Path, family: str, config_name: st
     outdir.mkdir(parents=True, exist_ok=True)
     base = pdf_path.stem
     out_path = outdir / f"{base}_enhanced.json"
-    with open(out_path, "w", encoding="utf-8") as f:
+    if orjson is not None:
+        # Same layout as json.dump(indent=2, ensure_ascii=False), serialized in C
+        out_path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
+        return out_path
+    # json.dump emits many small chunks; a 1 MiB buffer turns them into a few writes
+    with open(out_path, "w", encoding="utf-8", buffering=1 << 20) as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
         f.write("\n")
     return out_path
@@ -166,7 +299,12 @@ def main():
     ap.add_argument("--family", default="BOOKMARKS", help="Family to assign to bookmark-derived labels")
     ap.add_argument("--config", dest="config_name", default="bookmarks_v2", help="Config name to embed in JSON")
     ap.add_argument("--overwrite", action="store_true", help="Overwrite existing outputs if present")
-    ap.add_argument("--pattern", default="*.PDF", help="Glob pattern for PDFs when using --pdf_dir (case-sensitive)")
+    ap.add_argument("--pattern", default="*.PDF",
+                    help="Glob pattern for PDFs when using --pdf_dir. The default matches any "
+                         "extension case (.PDF, .pdf, ...); a custom pattern is globbed as given "
+                         "(case-sensitive on most filesystems)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="Worker processes for directory mode (default: CPU count)")
     args = ap.parse_args()
 
     outdir = Path(args.outdir)
@@ -188,36 +326,61 @@ def main():
     if not pdf_dir.exists() or not pdf_dir.is_dir():
         raise SystemExit(f"Not a directory: {pdf_dir}")
 
-    # gather files with both .PDF and .pdf by default
-    patterns = [args.pattern]
+    # The default pattern means any .pdf extension case, gathered in one directory
+    # scan; a custom --pattern is globbed as given
     if args.pattern == "*.PDF":
-        patterns.append("*.pdf")
-
-    files = []
-    for pat in patterns:
-        files.extend(sorted(pdf_dir.glob(pat)))
+        pattern_desc = "*.pdf (any case)"
+        with os.scandir(pdf_dir) as it:
+            files = sorted(
+                (Path(e.path) for e in it if e.name.lower().endswith(".pdf") and e.is_file()),
+                key=lambda p: p.name.lower(),
+            )
+    else:
+        pattern_desc = args.pattern
+        files = sorted(pdf_dir.glob(args.pattern))
 
     if not files:
-        print(f"No PDFs found in {pdf_dir} matching {patterns}")
+        print(f"No PDFs found in {pdf_dir} matching {pattern_desc}")
         return
 
     outdir.mkdir(parents=True, exist_ok=True)
     written = 0
     skipped = 0
     failed = 0
+    todo = []
     for pdf_path in files:
-        try:
-            out_path = outdir / f"{pdf_path.stem}_enhanced.json"
-            if out_path.exists() and not args.overwrite:
-                print(f"Skip (exists): {out_path}")
-                skipped += 1
-                continue
-            out_path = build_bookmark_gt(pdf_path, outdir, args.family, args.config_name)
-            print(f"Wrote {out_path}")
-            written += 1
-        except Exception as e:
-            print(f"Failed {pdf_path}: {e}")
-            failed += 1
+        out_path = outdir / f"{pdf_path.stem}_enhanced.json"
+        if out_path.exists() and not args.overwrite:
+            print(f"Skip (exists): {out_path}")
+            skipped += 1
+        else:
+            todo.append(pdf_path)
+
+    # PDFs are independent and outline parsing is CPU-bound pure Python, so fan out
+    # over processes; each worker writes its own output file
+    workers = max(1, min(args.workers, len(todo)))
+    if workers <= 1:
+        for pdf_path in todo:
+            try:
+                out_path = build_bookmark_gt(pdf_path, outdir, args.family, args.config_name)
+                print(f"Wrote {out_path}")
+                written += 1
+            except Exception as e:
+                print(f"Failed {pdf_path}: {e}")
+                failed += 1
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futs = {
+                ex.submit(build_bookmark_gt, pdf_path, outdir, args.family, args.config_name): pdf_path
+                for pdf_path in todo
+            }
+            for fut in as_completed(futs):
+                try:
+                    print(f"Wrote {fut.result()}")
+                    written += 1
+                except Exception as e:
+                    print(f"Failed {futs[fut]}: {e}")
+                    failed += 1
 
     print(f"Done. Written: {written}, Skipped: {skipped}, Failed: {failed}")
 